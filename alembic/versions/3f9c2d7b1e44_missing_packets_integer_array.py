@@ -0,0 +1,43 @@
+"""Store calls.missing_packets as an integer array
+
+Revision ID: 3f9c2d7b1e44
+Revises: a708dd915c92
+Create Date: 2026-10-15 22:10:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3f9c2d7b1e44'
+down_revision: Union[str, None] = 'a708dd915c92'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.alter_column(
+        'calls',
+        'missing_packets',
+        existing_type=sa.Text(),
+        type_=postgresql.ARRAY(sa.Integer()),
+        existing_nullable=False,
+        postgresql_using=(
+            "COALESCE(string_to_array(NULLIF(missing_packets, ''), ',')::integer[], '{}')"
+        ),
+    )
+
+
+def downgrade() -> None:
+    op.alter_column(
+        'calls',
+        'missing_packets',
+        existing_type=postgresql.ARRAY(sa.Integer()),
+        type_=sa.Text(),
+        existing_nullable=False,
+        postgresql_using="array_to_string(missing_packets, ',')",
+    )
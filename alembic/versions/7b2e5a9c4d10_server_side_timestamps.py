@@ -0,0 +1,32 @@
+"""Generate timestamps in the database
+
+Revision ID: 7b2e5a9c4d10
+Revises: 3f9c2d7b1e44
+Create Date: 2026-10-15 22:30:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7b2e5a9c4d10'
+down_revision: Union[str, None] = '3f9c2d7b1e44'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+UTC_NOW = sa.text("timezone('utc', now())")
+
+
+def upgrade() -> None:
+    op.alter_column('calls', 'created_at', existing_type=sa.DateTime(), server_default=UTC_NOW)
+    op.alter_column('calls', 'updated_at', existing_type=sa.DateTime(), server_default=UTC_NOW)
+    op.alter_column('call_packets', 'received_at', existing_type=sa.DateTime(), server_default=UTC_NOW)
+
+
+def downgrade() -> None:
+    op.alter_column('call_packets', 'received_at', existing_type=sa.DateTime(), server_default=None)
+    op.alter_column('calls', 'updated_at', existing_type=sa.DateTime(), server_default=None)
+    op.alter_column('calls', 'created_at', existing_type=sa.DateTime(), server_default=None)
@@ -1,11 +1,16 @@
 """
 Call API Routes
 """
-import time
-from typing import List
-from fastapi import APIRouter, Depends, HTTPException, status
+import asyncio
+import logging
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, List, Tuple
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Response, status
+from pydantic import TypeAdapter
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from app.config import settings
 from app.db.database import get_db
 from app.db.models import CallStatus
 from app.schemas.call_schemas import (
@@ -15,12 +20,97 @@ from app.schemas.call_schemas import (
     CallListResponse,
     CallDetailResponse
 )
-from app.services.call_service import CallService
+from app.services.call_service import CallService, PacketReceipt
+from app.services.packet_batcher import packet_batcher
 from app.utils.logger import setup_logger
 
 router = APIRouter(prefix="/v1/call", tags=["calls"])
 logger = setup_logger(__name__)
 
+# Validates a whole result set in one pydantic-core call
+_calls_adapter = TypeAdapter(List[CallResponse])
+
+# Recently stored packets: {(call_id, sequence): received_at}, oldest first.
+# Lets client retries be answered without touching the database.
+_RECENT_PACKETS_MAX = 65536
+_recent_packets: "OrderedDict[Tuple[str, int], datetime]" = OrderedDict()
+
+# Packets being written right now; a concurrent copy waits on the event
+# and is then answered from _recent_packets instead of being stored twice
+_packets_in_flight: Dict[Tuple[str, int], asyncio.Event] = {}
+
+
+def _after_ingest(call_id: str, sequence: int, status_msg: str):
+    """
+    Post-response bookkeeping for an ingested packet
+    
+    Runs as a background task once the 202 has been sent, so it must not
+    touch the request's database session. Only scheduled when DEBUG
+    logging is on: sequence gaps are already logged as warnings by
+    CallService.add_packets.
+    
+    Args:
+        call_id: Unique call identifier
+        sequence: Packet sequence number
+        status_msg: Status returned to the client
+    """
+    logger.debug("Packet %d for call %s stored (%s)", sequence, call_id, status_msg)
+
+
+def _remember_packet(key: Tuple[str, int], received_at: datetime):
+    """
+    Record a stored packet so a retry of it is answered as a duplicate
+    
+    Args:
+        key: (call_id, sequence)
+        received_at: When the packet was stored
+    """
+    _recent_packets[key] = received_at
+    if len(_recent_packets) > _RECENT_PACKETS_MAX:
+        _recent_packets.popitem(last=False)
+
+
+def _finish_in_flight(key: Tuple[str, int]):
+    """
+    Mark a packet's write as finished and wake any waiting copies
+    
+    Args:
+        key: (call_id, sequence)
+    """
+    _packets_in_flight.pop(key).set()
+
+
+def _on_buffered_write(key: Tuple[str, int], future: "asyncio.Future[PacketReceipt]"):
+    """
+    Completion callback for a write-behind packet
+    
+    The client was answered before this ran, so a failed write can only
+    be logged.
+    
+    Args:
+        key: (call_id, sequence)
+        future: Future returned by packet_batcher.submit
+    """
+    call_id, sequence = key
+    try:
+        if future.cancelled():
+            logger.error("Buffered packet %d for call %s was never written", sequence, call_id)
+            return
+        error = future.exception()
+        if error is not None:
+            logger.error(
+                "Buffered packet %d for call %s was lost: %s", sequence, call_id, error
+            )
+            return
+        
+        receipt = future.result()
+        _remember_packet(key, receipt.received_at)
+        if logger.isEnabledFor(logging.DEBUG):
+            status_msg = "accepted" if receipt.is_in_order else "accepted_with_warning"
+            _after_ingest(call_id, sequence, status_msg)
+    finally:
+        _finish_in_flight(key)
+
 
 @router.post(
     "/stream/{call_id}",
@@ -30,6 +120,8 @@ logger = setup_logger(__name__)
 async def stream_packet(
     call_id: str,
     packet: PacketMetadata,
+    background_tasks: BackgroundTasks,
+    response: Response,
     db: AsyncSession = Depends(get_db)
 ):
     """
@@ -41,52 +133,96 @@ async def stream_packet(
     - Returns 202 Accepted within < 50ms
     - Does not block on AI processing
     
+    A packet whose (call_id, sequence) was stored recently by this worker
+    is answered with status "duplicate" and not stored again. A copy that
+    arrives while the first one is still being written waits for that
+    write and is answered the same way (or stored itself if the write
+    failed). Debug logging runs after the response has been sent.
+    
+    With PACKET_WRITE_BEHIND enabled the packet is only queued: the
+    response (status "buffered", header X-Buffered: true) is sent before
+    it is written, so sequence warnings and write errors are logged but
+    not returned, and queued packets are lost if the process dies.
+    
     Args:
         call_id: Unique call identifier
         packet: Audio packet metadata
+        background_tasks: Post-response work queue
+        response: Outgoing response (for the X-Buffered header)
         db: Database session
         
     Returns:
         PacketResponse with acceptance confirmation
     """
-    start_time = time.time()
+    key = (call_id, packet.sequence)
+    while (in_flight := _packets_in_flight.get(key)) is not None:
+        await in_flight.wait()
+    
+    received_at = _recent_packets.get(key)
+    if received_at is not None:
+        _recent_packets.move_to_end(key)
+        return PacketResponse(
+            call_id=call_id,
+            sequence=packet.sequence,
+            status="duplicate",
+            received_at=received_at,
+            message=f"Packet {packet.sequence} already received"
+        )
     
+    # No await between the checks above and this, so exactly one copy
+    # of a packet is written at a time
+    _packets_in_flight[key] = asyncio.Event()
+    finish_on_write = False
     try:
-        # Get or create call
-        call = await CallService.get_or_create_call(db, call_id)
+        # Get or create call (cached for calls that are streaming)
+        await CallService.ensure_call(db, call_id)
         
-        # Add packet (validates sequence, logs missing packets)
-        packet_obj, is_in_order = await CallService.add_packet(
-            db=db,
-            call=call,
+        # Queue packet for the next batched write (validates sequence,
+        # logs missing packets)
+        write = packet_batcher.submit(
+            call_id=call_id,
             sequence=packet.sequence,
             data=packet.data,
             timestamp=packet.timestamp
         )
         
-        # Calculate processing time
-        processing_time = (time.time() - start_time) * 1000  # Convert to ms
+        if settings.PACKET_WRITE_BEHIND:
+            write.add_done_callback(lambda future: _on_buffered_write(key, future))
+            finish_on_write = True
+            response.headers["X-Buffered"] = "true"
+            return PacketResponse(
+                call_id=call_id,
+                sequence=packet.sequence,
+                status="buffered",
+                received_at=datetime.utcnow(),
+                message=f"Packet {packet.sequence} queued for storage"
+            )
         
-        status_msg = "accepted" if is_in_order else "accepted_with_warning"
+        # Wait until the packet's batch has been committed
+        receipt = await write
+        status_msg = "accepted" if receipt.is_in_order else "accepted_with_warning"
+        _remember_packet(key, receipt.received_at)
         
-        logger.info(
-            f"Packet {packet.sequence} for call {call_id} processed in {processing_time:.2f}ms"
-        )
+        if logger.isEnabledFor(logging.DEBUG):
+            background_tasks.add_task(_after_ingest, call_id, packet.sequence, status_msg)
         
         return PacketResponse(
             call_id=call_id,
             sequence=packet.sequence,
             status=status_msg,
-            received_at=packet_obj.received_at,
+            received_at=receipt.received_at,
             message=f"Packet {packet.sequence} received successfully"
         )
         
     except Exception as e:
-        logger.error(f"Error processing packet for call {call_id}: {str(e)}")
+        logger.error("Error processing packet for call %s: %s", call_id, e)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Failed to process packet: {str(e)}"
         )
+    finally:
+        if not finish_on_write:
+            _finish_in_flight(key)
 
 
 @router.post(
@@ -120,7 +256,7 @@ async def complete_call(
     
     # Check if already completed
     if call.status == CallStatus.COMPLETED:
-        logger.info(f"Call {call_id} is already completed")
+        logger.info("Call %s is already completed", call_id)
         return CallResponse.model_validate(call)
     
     # Check if in a state that can transition to COMPLETED
@@ -157,10 +293,12 @@ async def get_call_history(
         List of calls
     """
     calls = await CallService.get_all_calls(db, status=status, limit=limit)
+    calls_payload = _calls_adapter.validate_python(calls)
     
-    return CallListResponse(
-        calls=[CallResponse.model_validate(call) for call in calls],
-        total=len(calls)
+    # Items are already validated; skip re-validating the outer model
+    return CallListResponse.model_construct(
+        calls=calls_payload,
+        total=len(calls_payload)
     )
 
 
@@ -182,13 +320,14 @@ async def get_call_details(
     Returns:
         Detailed call information
     """
-    call = await CallService.get_call_by_id(db, call_id)
+    found = await CallService.get_call_by_id(db, call_id, with_packet_count=True)
     
-    if not call:
+    if not found:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"Call {call_id} not found"
         )
+    call, packets_count = found
     
     # Build response manually to include computed fields
     return CallDetailResponse(
@@ -204,6 +343,6 @@ async def get_call_details(
         sentiment=call.sentiment,
         ai_processed_at=call.ai_processed_at,
         error_message=call.error_message,
-        packets_count=len(call.packets),
+        packets_count=packets_count,
         ai_processing_attempts=call.ai_processing_attempts
     )
\ No newline at end of file
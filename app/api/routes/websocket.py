@@ -1,26 +1,90 @@
 """
 WebSocket Routes for Real-time Updates
 """
-from typing import List, Dict
+import asyncio
+import time
+from typing import List, Dict, Iterable, Optional, Set
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect
 from datetime import datetime
-import json
+import orjson
 
+from app.config import settings
 from app.utils.logger import setup_logger
 
 logger = setup_logger(__name__)
 
 router = APIRouter()
 
+# Room every client joins on connect; subscribers receive all events
+ALL_ROOM = "*"
+
+# Single-char wire codes for the fixed sentiment vocabulary; clients expand
+# them back. Unknown labels are sent unchanged.
+SENTIMENT_CODES = {
+    "positive": "p",
+    "neutral": "n",
+    "negative": "x",
+    "mixed": "m",
+}
+
+# Outbound event queue bound and max events coalesced per broadcaster pass
+WS_OUT_QUEUE_SIZE = 10_000
+WS_COALESCE_MAX = 64
+# Seconds allowed for closing a client we gave up sending to
+WS_CLOSE_TIMEOUT = 0.5
+
+
+# Last formatted timestamp: [epoch seconds, ISO string]
+_iso_cache: List = [0.0, ""]
+
+
+def _now_iso() -> str:
+    """
+    Current UTC time as an ISO-8601 string
+    
+    Bursty broadcasts share the formatted value for up to 1ms instead of
+    building a new datetime and string for every message. abs() keeps a
+    backwards wall-clock step (NTP) from freezing the cached value.
+    """
+    now = time.time()
+    if abs(now - _iso_cache[0]) >= 0.001:
+        _iso_cache[0] = now
+        _iso_cache[1] = datetime.utcfromtimestamp(now).isoformat()
+    return _iso_cache[1]
+
+
+async def _close_quietly(websocket: WebSocket):
+    """Close a client socket with 1011, giving up after WS_CLOSE_TIMEOUT"""
+    try:
+        await asyncio.wait_for(websocket.close(code=1011), timeout=WS_CLOSE_TIMEOUT)
+    except Exception as e:
+        logger.debug("Error closing WebSocket: %r", e)
+
+
+def call_room(call_id: str) -> str:
+    """Room name for events about a single call"""
+    return f"call:{call_id}"
+
 
 class ConnectionManager:
     """
     Manages WebSocket connections for real-time updates
+    
+    Clients are grouped into rooms so an event only reaches clients that
+    care about it. Every client starts in the "*" room (all events) and
+    can subscribe to per-call rooms ("call:{call_id}") instead.
     """
     
     def __init__(self):
         # Store active connections: {client_id: WebSocket}
         self.active_connections: Dict[str, WebSocket] = {}
+        # Room membership: {room: {client_id, ...}}
+        self.rooms: Dict[str, Set[str]] = {}
+        # Reverse index for cleanup: {client_id: {room, ...}}
+        self.client_rooms: Dict[str, Set[str]] = {}
+        # Outbound events waiting for the broadcaster task: (room, payload)
+        self._out_queue: Optional[asyncio.Queue] = None
+        self._broadcaster: Optional[asyncio.Task] = None
     
     async def connect(self, websocket: WebSocket, client_id: str):
         """
@@ -32,89 +96,229 @@ class ConnectionManager:
         """
         await websocket.accept()
         self.active_connections[client_id] = websocket
-        logger.info(f"🔌 WebSocket client {client_id} connected. Total connections: {len(self.active_connections)}")
+        self.subscribe(client_id, ALL_ROOM)
+        logger.info("🔌 WebSocket client %s connected. Total connections: %d", client_id, len(self.active_connections))
     
-    def disconnect(self, client_id: str):
+    def disconnect(self, client_id: str, websocket: Optional[WebSocket] = None):
         """
         Remove WebSocket connection
         
         Args:
             client_id: Client identifier to disconnect
+            websocket: Only disconnect if this is still the client's socket
+                       (a client may have reconnected under the same id)
         """
+        if websocket is not None and self.active_connections.get(client_id) is not websocket:
+            return
+        
+        for room in self.client_rooms.pop(client_id, ()):
+            members = self.rooms.get(room)
+            if members is not None:
+                members.discard(client_id)
+                if not members:
+                    del self.rooms[room]
+        
         if client_id in self.active_connections:
             del self.active_connections[client_id]
-            logger.info(f"🔌 WebSocket client {client_id} disconnected. Total connections: {len(self.active_connections)}")
+            logger.info("🔌 WebSocket client %s disconnected. Total connections: %d", client_id, len(self.active_connections))
     
-    async def send_personal_message(self, message: dict, client_id: str):
+    def subscribe(self, client_id: str, room: str):
         """
-        Send message to specific client
+        Add a client to a room
         
         Args:
-            message: Message dictionary
-            client_id: Target client identifier
+            client_id: Client identifier
+            room: Room name ("*" or "call:{call_id}")
         """
-        if client_id in self.active_connections:
-            websocket = self.active_connections[client_id]
-            await websocket.send_json(message)
+        if client_id not in self.active_connections:
+            return
+        self.rooms.setdefault(room, set()).add(client_id)
+        self.client_rooms.setdefault(client_id, set()).add(room)
+    
+    def unsubscribe(self, client_id: str, room: str):
+        """
+        Remove a client from a room
+        
+        Args:
+            client_id: Client identifier
+            room: Room name
+        """
+        members = self.rooms.get(room)
+        if members is not None:
+            members.discard(client_id)
+            if not members:
+                del self.rooms[room]
+        self.client_rooms.get(client_id, set()).discard(room)
     
-    async def broadcast(self, message: dict):
+    def _room_members(self, room: Optional[str]) -> Iterable[str]:
+        """Client ids that should receive an event published to room"""
+        if room is None:
+            return list(self.active_connections)
+        return self.rooms.get(room, set()) | self.rooms.get(ALL_ROOM, set())
+    
+    def publish(self, message: dict, room: Optional[str] = None):
         """
-        Broadcast message to all connected clients
+        Queue message for the broadcaster task and return immediately
+        
+        Callers on hot paths don't wait for fan-out. Events are dropped
+        (with a warning) if the outbound queue is full.
         
         Args:
             message: Message dictionary to broadcast
+            room: Target room, or None for every connected client
         """
-        logger.info(f"📢 Broadcasting to {len(self.active_connections)} clients: {message.get('type')}")
+        self._ensure_broadcaster()
+        try:
+            self._out_queue.put_nowait((room, orjson.dumps(message)))
+        except asyncio.QueueFull:
+            logger.warning("Outbound WebSocket queue full, dropping %s event", message.get("type"))
+    
+    async def stop(self):
+        """Deliver queued events and stop the broadcaster task"""
+        if self._broadcaster is None or self._broadcaster.done():
+            return
+        if self._broadcaster.get_loop() is not asyncio.get_running_loop():
+            self._broadcaster = None
+            return
         
-        # Send to all active connections
-        disconnected_clients = []
+        await self._out_queue.put(None)
+        await self._broadcaster
+        self._broadcaster = None
+    
+    def _ensure_broadcaster(self):
+        """Start the broadcaster task on the current event loop if needed"""
+        loop = asyncio.get_running_loop()
+        if (
+            self._broadcaster is None
+            or self._broadcaster.done()
+            or self._broadcaster.get_loop() is not loop
+        ):
+            self._out_queue = asyncio.Queue(maxsize=WS_OUT_QUEUE_SIZE)
+            self._broadcaster = loop.create_task(self._run_broadcaster())
+    
+    async def _run_broadcaster(self):
+        """
+        Drain queued events, coalescing bursts per room
         
-        for client_id, websocket in self.active_connections.items():
+        Up to WS_COALESCE_MAX queued events are taken at once. Events for
+        the same room are merged into a single JSON array frame; a lone
+        event is sent as a plain JSON object.
+        """
+        queue = self._out_queue
+        stopping = False
+        
+        while not stopping:
+            first = await queue.get()
+            if first is None:
+                break
+            
+            batch = [first]
+            while len(batch) < WS_COALESCE_MAX and not queue.empty():
+                item = queue.get_nowait()
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            
+            # Group payloads by room, preserving arrival order
+            by_room: Dict[Optional[str], List[bytes]] = {}
+            for room, payload in batch:
+                by_room.setdefault(room, []).append(payload)
+            
+            sends = []
+            for room, payloads in by_room.items():
+                merged = payloads[0] if len(payloads) == 1 else b"[" + b",".join(payloads) + b"]"
+                sends.append(self._send_payload(merged, room))
+            
             try:
-                await websocket.send_json(message)
+                await asyncio.gather(*sends)
             except Exception as e:
-                logger.error(f"Error sending to client {client_id}: {str(e)}")
-                disconnected_clients.append(client_id)
+                logger.error("Broadcaster error: %s", e)
+    
+    async def _send_payload(self, payload: bytes, room: Optional[str]):
+        """
+        Send pre-serialized bytes to every client in a room
+        
+        Args:
+            payload: Serialized JSON message
+            room: Target room, or None for every connected client
+        """
+        clients = [
+            (client_id, self.active_connections[client_id])
+            for client_id in self._room_members(room)
+            if client_id in self.active_connections
+        ]
+        if not clients:
+            return
+        
+        # Send concurrently so one slow client can't stall the rest;
+        # the timeout keeps a stuck write from pinning the broadcast
+        tasks = [
+            asyncio.create_task(
+                asyncio.wait_for(
+                    websocket.send_bytes(payload),
+                    timeout=settings.WS_SEND_TIMEOUT
+                )
+            )
+            for _, websocket in clients
+        ]
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        
+        # Collect clients whose send failed (results are positional), then
+        # remove them in one pass against the snapshotted sockets
+        disconnected_clients = []
+        for (client_id, websocket), result in zip(clients, results):
+            if isinstance(result, Exception):
+                logger.error("Error sending to client %s: %r", client_id, result)
+                disconnected_clients.append((client_id, websocket))
+        
+        if not disconnected_clients:
+            return
+        for client_id, websocket in disconnected_clients:
+            self.disconnect(client_id, websocket)
         
-        # Clean up disconnected clients
-        for client_id in disconnected_clients:
-            self.disconnect(client_id)
+        # Close the sockets too, so clients that are still connected know
+        # to reconnect instead of silently missing every later event
+        await asyncio.gather(
+            *(_close_quietly(websocket) for _, websocket in disconnected_clients)
+        )
     
-    async def broadcast_call_update(self, call_id: str, status: str, data: dict = None):
+    def broadcast_call_update(self, call_id: str, status: str, data: dict = None):
         """
-        Broadcast call status update
+        Queue call status update for broadcast
         
         Args:
             call_id: Call identifier
             status: New call status
-            data: Optional additional data
+            data: Optional additional data (omitted from the message when empty)
         """
         message = {
             "type": "call_update",
             "call_id": call_id,
             "status": status,
-            "data": data or {},
-            "timestamp": datetime.utcnow().isoformat()
+            "timestamp": _now_iso()
         }
-        await self.broadcast(message)
+        if data:
+            message["data"] = data
+        self.publish(message, room=call_room(call_id))
     
-    async def broadcast_ai_result(self, call_id: str, transcription: str, sentiment: str):
+    def broadcast_ai_result(self, call_id: str, transcription: str, sentiment: str):
         """
-        Broadcast AI processing result
+        Queue AI processing result for broadcast
         
         Args:
             call_id: Call identifier
             transcription: AI transcription text
-            sentiment: Sentiment analysis result
+            sentiment: Sentiment analysis result (sent as its SENTIMENT_CODES code)
         """
         message = {
             "type": "ai_result",
             "call_id": call_id,
             "transcription": transcription,
-            "sentiment": sentiment,
-            "timestamp": datetime.utcnow().isoformat()
+            "sentiment": SENTIMENT_CODES.get(sentiment, sentiment),
+            "timestamp": _now_iso()
         }
-        await self.broadcast(message)
+        self.publish(message, room=call_room(call_id))
     
     def get_connection_count(self) -> int:
         """Get number of active connections"""
@@ -137,6 +341,15 @@ async def websocket_endpoint(websocket: WebSocket, client_id: str):
     - ai_result: When AI processing completes
     - packet_received: When new packet arrives
     
+    Bursts of events for the same call may arrive as a JSON array of
+    messages in a single frame. ai_result sentiment is sent as a
+    single-char code (see SENTIMENT_CODES).
+    
+    Clients receive every event by default ("*" room). To follow specific
+    calls only, send {"subscribe": ["call:CALL-001"], "unsubscribe": ["*"]}.
+    Both fields must be lists of room names, otherwise an error frame is
+    sent back and nothing changes. Any other text is echoed back as a heartbeat pong.
+    
     Args:
         websocket: WebSocket connection
         client_id: Unique client identifier
@@ -145,30 +358,89 @@ async def websocket_endpoint(websocket: WebSocket, client_id: str):
     
     try:
         # Send welcome message
-        await websocket.send_json({
+        await websocket.send_bytes(orjson.dumps({
             "type": "connected",
             "message": f"Welcome client {client_id}",
-            "timestamp": datetime.utcnow().isoformat()
-        })
+            "timestamp": _now_iso()
+        }))
         
         # Keep connection alive and listen for messages
         while True:
-            # Receive messages from client (heartbeat, etc.)
+            # Receive messages from client (heartbeat, subscriptions)
             data = await websocket.receive_text()
             
+            # Dropped after a failed send but the close didn't get through:
+            # end the connection rather than answer pings with no events
+            if manager.active_connections.get(client_id) is not websocket:
+                await _close_quietly(websocket)
+                break
+            
+            if data.startswith("{"):
+                reply = _handle_subscription(client_id, data)
+                if reply is not None:
+                    await websocket.send_bytes(orjson.dumps(reply))
+                    continue
+            
             # Echo back for heartbeat
-            await websocket.send_json({
+            await websocket.send_bytes(orjson.dumps({
                 "type": "pong",
                 "received": data,
-                "timestamp": datetime.utcnow().isoformat()
-            })
+                "timestamp": _now_iso()
+            }))
             
     except WebSocketDisconnect:
-        manager.disconnect(client_id)
-        logger.info(f"Client {client_id} disconnected normally")
+        manager.disconnect(client_id, websocket)
+        logger.info("Client %s disconnected normally", client_id)
     except Exception as e:
-        logger.error(f"WebSocket error for client {client_id}: {str(e)}")
-        manager.disconnect(client_id)
+        logger.error("WebSocket error for client %s: %s", client_id, e)
+        manager.disconnect(client_id, websocket)
+
+
+def _handle_subscription(client_id: str, data: str) -> Optional[dict]:
+    """
+    Apply a {"subscribe": [...], "unsubscribe": [...]} control message
+    
+    Args:
+        client_id: Client sending the message
+        data: Raw text frame
+        
+    Returns:
+        Reply frame (the client's rooms after the change, or an error if
+        the fields are not lists of strings), or None if data is not a
+        subscription message
+    """
+    try:
+        message = orjson.loads(data)
+    except orjson.JSONDecodeError:
+        return None
+    
+    if not isinstance(message, dict) or not (
+        "subscribe" in message or "unsubscribe" in message
+    ):
+        return None
+    
+    subscribe = message.get("subscribe") or []
+    unsubscribe = message.get("unsubscribe") or []
+    if not all(
+        isinstance(rooms, list) and all(isinstance(room, str) for room in rooms)
+        for rooms in (subscribe, unsubscribe)
+    ):
+        return {
+            "type": "error",
+            "message": "subscribe and unsubscribe must be lists of room names",
+            "timestamp": _now_iso()
+        }
+    
+    for room in subscribe:
+        manager.subscribe(client_id, room)
+    for room in unsubscribe:
+        manager.unsubscribe(client_id, room)
+    
+    return {
+        "type": "subscribed",
+        "rooms": sorted(manager.client_rooms.get(client_id, set())),
+        "timestamp": _now_iso()
+    }
 
 
 @router.get("/ws/stats")
@@ -176,5 +448,6 @@ async def websocket_stats():
     """Get WebSocket connection statistics"""
     return {
         "active_connections": manager.get_connection_count(),
-        "timestamp": datetime.utcnow().isoformat()
+        "rooms": len(manager.rooms),
+        "timestamp": _now_iso()
     }
\ No newline at end of file
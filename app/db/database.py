@@ -1,33 +1,63 @@
 """
 Database Connection and Session Management
 """
+from functools import lru_cache
 from typing import AsyncGenerator
 from sqlalchemy.ext.asyncio import (
+    AsyncEngine,
     AsyncSession,
     async_sessionmaker,
     create_async_engine
 )
-from sqlalchemy.pool import NullPool
 from app.config import settings
 from app.db.models import Base
 
 
-# Create async engine
-engine = create_async_engine(
-    settings.DATABASE_URL,
-    echo=settings.DEBUG,
-    poolclass=NullPool,  # Use NullPool for better connection handling
-    future=True
-)
+@lru_cache(maxsize=1)
+def get_engine() -> AsyncEngine:
+    """
+    Create the async engine once per process
 
-# Create async session factory
-AsyncSessionLocal = async_sessionmaker(
-    engine,
-    class_=AsyncSession,
-    expire_on_commit=False,
-    autocommit=False,
-    autoflush=False
-)
+    Uses the default AsyncAdaptedQueuePool so connections are reused across
+    requests instead of paying a fresh connect + auth handshake every time.
+    Keep DB_POOL_SIZE + DB_MAX_OVERFLOW >= the expected request concurrency
+    per worker.
+
+    Each pooled connection keeps an LRU of server-side prepared statements,
+    so repeated ingestion/processing queries skip parse and plan. The
+    cache is sized to hold every distinct statement the service issues.
+    """
+    return create_async_engine(
+        settings.DATABASE_URL,
+        echo=settings.SQL_ECHO,
+        echo_pool=False,
+        hide_parameters=True,
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW,
+        pool_pre_ping=True,
+        pool_recycle=settings.DB_POOL_RECYCLE,
+        connect_args={
+            "prepared_statement_cache_size": settings.DB_STATEMENT_CACHE_SIZE
+        },
+        future=True
+    )
+
+
+@lru_cache(maxsize=1)
+def get_sessionmaker() -> async_sessionmaker[AsyncSession]:
+    """Create the async session factory bound to the cached engine"""
+    return async_sessionmaker(
+        get_engine(),
+        class_=AsyncSession,
+        expire_on_commit=False,
+        autocommit=False,
+        autoflush=False
+    )
+
+
+# Module-level aliases for existing imports
+engine = get_engine()
+AsyncSessionLocal = get_sessionmaker()
 
 
 async def init_db():
@@ -45,4 +75,4 @@ async def get_db() -> AsyncGenerator[AsyncSession, None]:
         try:
             yield session
         finally:
-            await session.close()
\ No newline at end of file
+            await session.close()
@@ -1,18 +1,28 @@
 """
 SQLAlchemy Database Models
 """
-from datetime import datetime
 from enum import Enum as PyEnum
 from sqlalchemy import (
     Column, String, Integer, Float, DateTime, Text, 
-    ForeignKey, Enum, Boolean, Index
+    ForeignKey, Boolean, Index, func
 )
+from sqlalchemy.dialects.postgresql import ARRAY, ENUM
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 
 Base = declarative_base()
 
 
+def utc_now():
+    """
+    SQL expression for the current UTC time
+    
+    Timestamp columns are naive UTC, so convert now() (timestamptz)
+    explicitly rather than depending on the session TimeZone.
+    """
+    return func.timezone("utc", func.now())
+
+
 class CallStatus(str, PyEnum):
     """Call status enum for state machine"""
     IN_PROGRESS = "IN_PROGRESS"
@@ -32,17 +42,18 @@ class Call(Base):
     
     id = Column(Integer, primary_key=True, index=True)
     call_id = Column(String(100), unique=True, index=True, nullable=False)
-    status = Column(Enum(CallStatus), default=CallStatus.IN_PROGRESS, nullable=False)
+    # Native Postgres enum: stored as a 4-byte OID reference, rows come back as CallStatus
+    status = Column(ENUM(CallStatus, name="callstatus"), default=CallStatus.IN_PROGRESS, nullable=False)
     
     # Metadata
-    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+    created_at = Column(DateTime, server_default=utc_now(), nullable=False)
+    updated_at = Column(DateTime, server_default=utc_now(), onupdate=utc_now(), nullable=False)
     completed_at = Column(DateTime, nullable=True)
     
     # Packet tracking
-    expected_sequence = Column(Integer, default=0, nullable=False)
+    expected_sequence = Column(Integer, default=0, nullable=False)  # Highest stored sequence + 1; read under the row lock
     total_packets = Column(Integer, default=0, nullable=False)
-    missing_packets = Column(Text, default="", nullable=False)  # Comma-separated list
+    missing_packets = Column(ARRAY(Integer), default=list, nullable=False)  # Sorted sequence numbers
     
     # AI Processing results
     transcription = Column(Text, nullable=True)
@@ -54,13 +65,23 @@ class Call(Base):
     error_message = Column(Text, nullable=True)
     
     # Relationships
-    packets = relationship("CallPacket", back_populates="call", cascade="all, delete-orphan")
+    # Loaded in sequence order via idx_call_sequence; never sort in Python
+    packets = relationship(
+        "CallPacket",
+        back_populates="call",
+        cascade="all, delete-orphan",
+        order_by="CallPacket.sequence"
+    )
     
     # Indexes for query performance
     __table_args__ = (
         Index('idx_call_status_updated', 'status', 'updated_at'),
     )
     
+    # Fetch server-generated timestamps with RETURNING on flush instead of
+    # expiring them (which would need a lazy load under asyncio)
+    __mapper_args__ = {"eager_defaults": True}
+    
     def __repr__(self):
         return f"<Call(call_id={self.call_id}, status={self.status})>"
 
@@ -76,12 +97,13 @@ class CallPacket(Base):
     sequence = Column(Integer, nullable=False)
     data = Column(Text, nullable=False)
     timestamp = Column(Float, nullable=False)
-    received_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    received_at = Column(DateTime, server_default=utc_now(), nullable=False)
     
     # Relationship
     call = relationship("Call", back_populates="packets")
     
-    # Composite index for efficient sequence queries
+    # Composite index for efficient sequence queries; also serves the
+    # per-call MAX(sequence) lookup during ingestion via a backward scan
     __table_args__ = (
         Index('idx_call_sequence', 'call_id', 'sequence'),
     )
@@ -2,14 +2,20 @@
 PBX Microservice - Main Application
 """
 import asyncio
+import time
 from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 
 from app.db.database import init_db
 from app.api.routes import calls, websocket
+from app.api.routes.websocket import manager as websocket_manager
 from app.config import settings
 from app.services.call_processor import call_processor
+from app.services.packet_batcher import packet_batcher
 from app.utils.logger import setup_logger
 
 logger = setup_logger(__name__)
@@ -29,7 +35,7 @@ async def lifespan(app: FastAPI):
     processor_task = asyncio.create_task(call_processor.start())
     logger.info("✅ Background call processor started")
     
-    logger.info(f"🚀 Server ready at http://{settings.APP_HOST}:{settings.APP_PORT}")
+    logger.info("🚀 Server ready at http://%s:%s", settings.APP_HOST, settings.APP_PORT)
     
     yield
     
@@ -42,6 +48,45 @@ async def lifespan(app: FastAPI):
     except asyncio.CancelledError:
         pass
     logger.info("✅ Background processor stopped")
+    
+    await packet_batcher.stop()
+    logger.info("✅ Packet batcher flushed")
+    
+    await websocket_manager.stop()
+    logger.info("✅ WebSocket broadcaster stopped")
+
+
+class RequestTimingMiddleware:
+    """
+    ASGI middleware that measures request latency
+    
+    Adds an x-process-ms header to every HTTP response and only logs
+    requests slower than settings.SLOW_REQUEST_MS, so fast requests
+    cost no log I/O.
+    """
+    
+    def __init__(self, app: ASGIApp):
+        self.app = app
+    
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        
+        start_ns = time.perf_counter_ns()
+        
+        async def send_with_timing(message: Message):
+            if message["type"] == "http.response.start":
+                elapsed_ms = (time.perf_counter_ns() - start_ns) / 1e6
+                MutableHeaders(scope=message).append("x-process-ms", f"{elapsed_ms:.2f}")
+                if elapsed_ms > settings.SLOW_REQUEST_MS:
+                    logger.warning(
+                        "Slow request %s %s: %.2fms",
+                        scope["method"], scope["path"], elapsed_ms
+                    )
+            await send(message)
+        
+        await self.app(scope, receive, send_with_timing)
 
 
 # Create FastAPI application
@@ -49,6 +94,7 @@ app = FastAPI(
     title="PBX Microservice",
     description="High-performance microservice for PBX call streaming with AI processing",
     version="1.0.0",
+    default_response_class=ORJSONResponse,
     lifespan=lifespan
 )
 
@@ -61,6 +107,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Report per-request latency (header + slow-request warnings)
+app.add_middleware(RequestTimingMiddleware)
+
 # Include routers
 app.include_router(calls.router)
 app.include_router(websocket.router)
@@ -82,6 +131,7 @@ async def health_check():
     return {
         "status": "healthy",
         "database": "connected",
+        "buffer_depth": packet_batcher.depth,
         "processor": call_processor.get_stats()
     }
 
@@ -89,4 +139,22 @@ async def health_check():
 @app.get("/stats")
 async def get_stats():
     """Get service statistics"""
-    return call_processor.get_stats()
\ No newline at end of file
+    return call_processor.get_stats()
+
+
+if __name__ == "__main__":
+    import uvicorn
+    
+    # uvloop + httptools keep per-socket event loop overhead low for the
+    # many long-lived /ws connections; both ship with uvicorn[standard]
+    uvicorn.run(
+        "app.main:app",
+        host=settings.APP_HOST,
+        port=settings.APP_PORT,
+        loop="uvloop",
+        http="httptools",
+        ws="websockets",
+        # permessage-deflate with context takeover: repeated keys across
+        # broadcast frames compress to a few bytes
+        ws_per_message_deflate=True
+    )
@@ -3,16 +3,31 @@ Pydantic Schemas for Request/Response Validation
 """
 from datetime import datetime
 from typing import Optional, List
-from pydantic import BaseModel, Field, validator
+from pydantic import BaseModel, Field, field_validator, validator
 from app.db.models import CallStatus
 
 
+def _missing_packets_csv(value):
+    """Render the missing_packets int array as the API's comma-separated string"""
+    if isinstance(value, (list, tuple)):
+        return ','.join(map(str, value))
+    return value
+
+
 class PacketMetadata(BaseModel):
     """Schema for incoming audio packet metadata"""
-    sequence: int = Field(..., ge=0, description="Packet sequence number")
+    sequence: int = Field(..., ge=0, le=2147483647, description="Packet sequence number")
     data: str = Field(..., min_length=1, description="Audio metadata payload")
     timestamp: float = Field(..., gt=0, description="Packet timestamp")
     
+    @field_validator("data")
+    @classmethod
+    def data_without_nul(cls, value: str) -> str:
+        # PostgreSQL text columns cannot store NUL characters
+        if "\x00" in value:
+            raise ValueError("data must not contain NUL characters")
+        return value
+    
     class Config:
         json_schema_extra = {
             "example": {
@@ -50,6 +65,11 @@ class CallResponse(BaseModel):
     ai_processed_at: Optional[datetime] = None
     error_message: Optional[str] = None
     
+    @field_validator("missing_packets", mode="before")
+    @classmethod
+    def missing_packets_as_csv(cls, value):
+        return _missing_packets_csv(value)
+    
     class Config:
         from_attributes = True
         use_enum_values = True
@@ -72,6 +92,11 @@ class CallDetailResponse(BaseModel):
     packets_count: int
     ai_processing_attempts: int
     
+    @field_validator("missing_packets", mode="before")
+    @classmethod
+    def missing_packets_as_csv(cls, value):
+        return _missing_packets_csv(value)
+    
     class Config:
         from_attributes = True
         use_enum_values = True
@@ -53,7 +53,7 @@ class AIService:
         self.request_count += 1
         request_id = self.request_count
         
-        logger.info(f"AI Service Request #{request_id} for call {call_id}")
+        logger.info("AI Service Request #%d for call %s", request_id, call_id)
         
         # Simulate variable latency (1-3 seconds)
         latency = random.uniform(self.min_latency, self.max_latency)
@@ -63,8 +63,8 @@ class AIService:
         if random.random() < self.failure_rate:
             self.failure_count += 1
             logger.error(
-                f"AI Service Request #{request_id} FAILED for call {call_id} "
-                f"(latency: {latency:.2f}s, failure rate: {self.failure_count}/{self.request_count})"
+                "AI Service Request #%d FAILED for call %s (latency: %.2fs, failure rate: %d/%d)",
+                request_id, call_id, latency, self.failure_count, self.request_count
             )
             raise AIServiceError("503 Service Unavailable - AI service temporarily unavailable")
         
@@ -78,8 +78,8 @@ class AIService:
         sentiment = self._generate_mock_sentiment()
         
         logger.info(
-            f"AI Service Request #{request_id} SUCCESS for call {call_id} "
-            f"(latency: {latency:.2f}s, sentiment: {sentiment})"
+            "AI Service Request #%d SUCCESS for call %s (latency: %.2fs, sentiment: %s)",
+            request_id, call_id, latency, sentiment
         )
         
         return {
@@ -3,17 +3,18 @@ Call Processor - Background Task Handler
 Orchestrates AI processing for completed calls
 """
 import asyncio
+import logging
 from typing import List
-from datetime import datetime
+from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select as sql_select
-from sqlalchemy.orm import selectinload
 
 from app.api.routes.websocket import manager as websocket_manager
-from app.db.database import AsyncSessionLocal
-from app.db.models import Call, CallStatus
+from app.config import settings
+from app.db.database import AsyncSessionLocal, engine
+from app.db.models import Call, CallStatus, utc_now
 from app.services.ai_service import ai_service, AIServiceError
-from app.services.call_service import CallService
+from app.services.call_service import CallService, CALL_READY_CHANNEL
+from app.services.circuit_breaker import AsyncCircuitBreaker, CircuitOpenError
 from app.services.retry_strategy import retry_with_backoff
 from app.utils.logger import setup_logger
 
@@ -25,65 +26,170 @@ class CallProcessor:
     Background processor for AI transcription and sentiment analysis
     
     Workflow:
-    1. Poll for calls in COMPLETED status
-    2. Transition to PROCESSING_AI
-    3. Combine all packet data
+    1. Wait for a call_ready NOTIFY (or the fallback poll interval)
+    2. Claim a batch of COMPLETED calls as PROCESSING_AI
+    3. Combine all packet data (calls in a batch run concurrently)
     4. Send to AI service with retry logic
     5. Store results and transition to COMPLETED or FAILED
     """
     
-    def __init__(self, poll_interval: int = 5):
+    def __init__(
+        self,
+        poll_interval: int = 30,
+        batch_size: int = 20,
+        max_concurrency: int = 16,
+        lease_seconds: int = 300
+    ):
         """
         Initialize call processor
         
         Args:
-            poll_interval: Seconds between polling for new calls (default: 5)
+            poll_interval: Max seconds between scans when no call_ready
+                notification arrives (default: 30)
+            batch_size: Max calls claimed per scan (default: 20)
+            max_concurrency: Max calls processed at once (default: 16)
+            lease_seconds: Seconds before a claimed but unfinished call
+                is claimed again (default: 300)
         """
         self.poll_interval = poll_interval
+        self.batch_size = batch_size
+        self.lease_seconds = lease_seconds
+        self._slots = asyncio.Semaphore(max_concurrency)
+        self._breaker = AsyncCircuitBreaker(
+            failure_threshold=settings.AI_BREAKER_FAILURE_THRESHOLD,
+            reset_timeout=settings.AI_BREAKER_RESET_TIMEOUT
+        )
         self.is_running = False
         self.processed_count = 0
+        self.empty_calls_skipped = 0
+        self._wake = asyncio.Event()
     
     async def start(self):
         """Start the background processor"""
         self.is_running = True
         logger.info("🤖 Call Processor started")
         
+        listener_task = asyncio.create_task(self._listen_for_ready_calls())
+        try:
+            while self.is_running:
+                try:
+                    claimed = await self._process_pending_calls()
+                except Exception as e:
+                    logger.error("Error in call processor loop: %s", e)
+                    claimed = 0
+                
+                # A full batch means more calls may be waiting: scan again
+                # straight away, unless the circuit is bouncing them back
+                if (
+                    claimed >= self.batch_size
+                    and self._breaker.state != AsyncCircuitBreaker.OPEN
+                ):
+                    continue
+                
+                # Sleep until a call becomes ready, polling as a fallback
+                try:
+                    await asyncio.wait_for(self._wake.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                self._wake.clear()
+        finally:
+            listener_task.cancel()
+            try:
+                await listener_task
+            except asyncio.CancelledError:
+                pass
+    
+    async def _listen_for_ready_calls(self):
+        """
+        LISTEN on the call_ready channel and wake the processing loop
+        
+        Holds one pooled connection for as long as the processor runs. If
+        the connection drops, it reconnects after poll_interval; the
+        fallback poll keeps calls moving in the meantime.
+        """
+        def on_notify(connection, pid, channel, payload):
+            self._wake.set()
+        
         while self.is_running:
             try:
-                await self._process_pending_calls()
+                async with engine.connect() as conn:
+                    raw = await conn.get_raw_connection()
+                    pg_conn = raw.driver_connection
+                    
+                    lost = asyncio.Event()
+                    pg_conn.add_termination_listener(lambda connection: lost.set())
+                    await pg_conn.add_listener(CALL_READY_CHANNEL, on_notify)
+                    logger.info("👂 Listening for %s notifications", CALL_READY_CHANNEL)
+                    
+                    try:
+                        await lost.wait()
+                    finally:
+                        if not pg_conn.is_closed():
+                            await pg_conn.remove_listener(CALL_READY_CHANNEL, on_notify)
+                
+                logger.warning("%s listener connection lost", CALL_READY_CHANNEL)
+            except asyncio.CancelledError:
+                raise
             except Exception as e:
-                logger.error(f"Error in call processor loop: {str(e)}")
+                logger.error("%s listener error: %s", CALL_READY_CHANNEL, e)
             
-            # Wait before next poll
+            # Scan now in case a notification was missed, then reconnect
+            self._wake.set()
             await asyncio.sleep(self.poll_interval)
     
     def stop(self):
         """Stop the background processor"""
         self.is_running = False
+        self._wake.set()
         logger.info("🛑 Call Processor stopped")
     
-    async def _process_pending_calls(self):
-        """Process all pending calls"""
+    async def _process_pending_calls(self) -> int:
+        """
+        Claim and process one batch of pending calls
+        
+        Returns:
+            Number of calls claimed (batch_size means more may be waiting)
+        """
         async with AsyncSessionLocal() as db:
             try:
-                # Get calls ready for processing
-                calls = await CallService.get_calls_for_processing(db)
-                
-                # Always log what we found (even if 0)
-                logger.info(f"📋 Polling for pending calls... Found: {len(calls)}")
-                
-                if calls:
-                    logger.info(f"🔄 Processing {len(calls)} calls")
-                    for call in calls:
-                        logger.info(f"  - Call {call.call_id} (status: {call.status})")
-                
-                for call in calls:
-                    try:
-                        await self._process_single_call(db, call)
-                    except Exception as e:
-                        logger.error(f"Failed to process call {call.call_id}: {str(e)}")
+                # Claim a batch of calls ready for processing
+                calls = await CallService.get_calls_for_processing(
+                    db, limit=self.batch_size, lease_seconds=self.lease_seconds
+                )
             except Exception as e:
-                logger.error(f"Error getting pending calls: {str(e)}")
+                logger.error("Error getting pending calls: %s", e)
+                return 0
+        
+        if not calls:
+            logger.debug("📋 Polling for pending calls... Found: 0")
+            return 0
+        
+        logger.info("🔄 Processing %d calls", len(calls))
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Batch: %s", [call.call_id for call in calls])
+        
+        # AI calls are I/O bound: overlap them, each with its own session
+        await asyncio.gather(*(self._run_one(call) for call in calls))
+        return len(calls)
+    
+    async def _run_one(self, call: Call):
+        """
+        Process one claimed call in its own session
+        
+        Concurrency is capped by the max_concurrency semaphore.
+        
+        Args:
+            call: Claimed Call object (detached from the claim session)
+        """
+        call_id = call.call_id
+        async with self._slots:
+            async with AsyncSessionLocal() as db:
+                try:
+                    # Attach the already-loaded row without another SELECT
+                    call = await db.merge(call, load=False)
+                    await self._process_single_call(db, call)
+                except Exception as e:
+                    logger.error("Failed to process call %s: %s", call_id, e)
     
     async def _process_single_call(self, db: AsyncSession, call: Call):
         """
@@ -93,90 +199,94 @@ class CallProcessor:
             db: Database session
             call: Call object to process
         """
-        logger.info(f"🔧 Processing call {call.call_id}")
+        logger.info("🔧 Processing call %s", call.call_id)
         
         try:
-            # Step 1: Transition to PROCESSING_AI
-            logger.info(f"Step 1: Transitioning {call.call_id} to PROCESSING_AI")
-            call = await CallService.update_call_status(
-                db, call, CallStatus.PROCESSING_AI
-            )
+            # Step 1-2: The call was claimed as PROCESSING_AI for the whole
+            # batch by get_calls_for_processing
             
-            # Step 2: Get fresh call with packets loaded
-            logger.info(f"Step 2: Loading packets for {call.call_id}")
+            # Fail fast while the AI service is down, before any query
+            if not self._breaker.allow_request():
+                raise CircuitOpenError("AI service circuit open")
             
-            result = await db.execute(
-                sql_select(Call)
-                .options(selectinload(Call.packets))
-                .where(Call.call_id == call.call_id)
-            )
-            call_with_packets = result.scalar_one()
-            
-            # Step 3: Combine packet data
-            logger.info(f"Step 3: Combining {len(call_with_packets.packets)} packets")
-            audio_data = self._combine_packet_data(call_with_packets)
-            logger.info(f"Combined audio data length: {len(audio_data)} chars")
+            # Step 3: Combine packet data (joined in SQL)
+            logger.info("Step 3: Combining packets for %s", call.call_id)
+            try:
+                audio_data = await CallService.aggregate_packet_data(db, call.call_id)
+            except BaseException:
+                self._breaker.release_probe()
+                raise
+            logger.info("Combined audio data length: %d chars", len(audio_data))
             
-            # Step 4: Process with AI service (with retry logic)
-            logger.info(f"Step 4: Sending to AI service")
-            ai_result = await self._process_with_retry(call.call_id, audio_data)
+            if not audio_data.strip():
+                # Nothing to transcribe: don't spend an AI request (and its
+                # retries) on it
+                self._breaker.release_probe()
+                logger.warning("Call %s has no packet data, skipping AI", call.call_id)
+                CallService.apply_status(
+                    call, CallStatus.FAILED, error_message="No packet data"
+                )
+                await db.commit()
+                self.empty_calls_skipped += 1
+                
+                websocket_manager.broadcast_call_update(
+                    call_id=call.call_id,
+                    status="FAILED",
+                    data={"error": "No packet data"}
+                )
+                return
             
-            # Step 5: Update call with results in a fresh query
-            logger.info(f"Step 5: Updating call with AI results")
-            result = await db.execute(
-                sql_select(Call).where(Call.call_id == call.call_id)
-            )
-            call = result.scalar_one()
+            # Step 4: Process with AI service (circuit breaker + retry logic)
+            logger.info("Step 4: Sending to AI service")
+            ai_result = await self._call_ai_service(call.call_id, audio_data)
             
+            # Step 5: Record AI results and move back to COMPLETED
+            logger.info("Step 5: Saving AI results and transitioning back to COMPLETED")
             call.transcription = ai_result["transcription"]
             call.sentiment = ai_result["sentiment"]
-            call.ai_processed_at = datetime.utcnow()
+            call.ai_processed_at = utc_now()
             call.ai_processing_attempts += 1
+            CallService.apply_status(call, CallStatus.COMPLETED)
             
+            # Step 6: One commit for results and status
             await db.commit()
-            await db.refresh(call)
-            
-            # Step 6: Transition back to COMPLETED
-            # Step 6: Transition back to COMPLETED
-            logger.info(f"Step 6: Transitioning back to COMPLETED")
-            call = await CallService.update_call_status(
-                db, call, CallStatus.COMPLETED
-            )
             
             self.processed_count += 1
             logger.info(
-                f"✅ Successfully processed call {call.call_id} "
-                f"(sentiment: {call.sentiment})"
+                "✅ Successfully processed call %s (sentiment: %s)",
+                call.call_id, call.sentiment
             )
             
             # Broadcast AI result via WebSocket
-            await websocket_manager.broadcast_ai_result(
+            websocket_manager.broadcast_ai_result(
                 call_id=call.call_id,
                 transcription=call.transcription,
                 sentiment=call.sentiment
             )
             
+        except CircuitOpenError as e:
+            # AI service is known to be down: hand the call back untouched
+            # so it is claimed again once the circuit closes
+            # Only the claim is undone: completed_at keeps the time the
+            # call actually ended
+            logger.warning("Skipping %s: %s", call.call_id, e)
+            call.status = CallStatus.COMPLETED
+            await db.commit()
+            
         except AIServiceError as e:
             # AI service failed after all retries
-            logger.error(f"AI Service failed for {call.call_id}: {str(e)}")
-            
-            # Get fresh call object
-            result = await db.execute(
-                sql_select(Call).where(Call.call_id == call.call_id)
-            )
-            call = result.scalar_one()
+            logger.error("AI Service failed for %s: %s", call.call_id, e)
             
             call.ai_processing_attempts += 1
-            await db.commit()
-            
-            call = await CallService.update_call_status(
-                db, call, CallStatus.FAILED,
+            CallService.apply_status(
+                call, CallStatus.FAILED,
                 error_message=f"AI service failed after retries: {str(e)}"
             )
-            logger.error(f"❌ Failed to process call {call.call_id} after retries")
+            await db.commit()
+            logger.error("❌ Failed to process call %s after retries", call.call_id)
             
             # Broadcast failure via WebSocket
-            await websocket_manager.broadcast_call_update(
+            websocket_manager.broadcast_call_update(
                 call_id=call.call_id,
                 status="FAILED",
                 data={"error": str(e)}
@@ -184,45 +294,56 @@ class CallProcessor:
             
         except Exception as e:
             # Unexpected error
-            logger.error(f"Unexpected error for {call.call_id}: {str(e)}", exc_info=True)
+            logger.error("Unexpected error for %s: %s", call.call_id, e, exc_info=True)
             
             try:
-                # Get fresh call object
-                result = await db.execute(
-                    sql_select(Call).where(Call.call_id == call.call_id)
-                )
-                call = result.scalar_one()
+                if isinstance(e, SQLAlchemyError):
+                    # Failed transaction: start clean and reload the row.
+                    # Rolling back expires every object in the session, so
+                    # only do it when the database actually failed.
+                    await db.rollback()
+                    await db.refresh(call)
                 
                 call.ai_processing_attempts += 1
-                await db.commit()
-                
-                call = await CallService.update_call_status(
-                    db, call, CallStatus.FAILED,
+                CallService.apply_status(
+                    call, CallStatus.FAILED,
                     error_message=f"Unexpected error: {str(e)}"
                 )
+                await db.commit()
             except Exception as inner_e:
-                logger.error(f"Failed to mark call as FAILED: {str(inner_e)}")
+                logger.error("Failed to mark call as FAILED: %s", inner_e)
     
-    def _combine_packet_data(self, call: Call) -> str:
+    async def _call_ai_service(self, call_id: str, audio_data: str) -> dict:
         """
-        Combine all packet data into single audio string
+        Call the AI service and report the outcome to the circuit breaker
+        
+        The caller must already have been let through by
+        self._breaker.allow_request(). Errors other than AIServiceError
+        say nothing about the service, so they only release the permit.
         
         Args:
-            call: Call object with packets loaded
+            call_id: Unique call identifier
+            audio_data: Combined audio packet data
             
         Returns:
-            Combined audio data string
+            AI processing results
+            
+        Raises:
+            AIServiceError: If all retry attempts fail
         """
-        if not call.packets:
-            return ""
-        
-        # Sort packets by sequence
-        sorted_packets = sorted(call.packets, key=lambda p: p.sequence)
-        
-        # Combine data
-        combined = " ".join([p.data for p in sorted_packets])
+        try:
+            result = await self._process_with_retry(call_id, audio_data)
+        except AIServiceError:
+            self._breaker.record_failure()
+            raise
+        except BaseException:
+            # Not a verdict on the AI service (bug, cancellation, ...): free
+            # the half-open probe slot so the circuit can't get stuck
+            self._breaker.release_probe()
+            raise
         
-        return combined
+        self._breaker.record_success()
+        return result
     
     @retry_with_backoff
     async def _process_with_retry(self, call_id: str, audio_data: str) -> dict:
@@ -231,7 +352,7 @@ class CallProcessor:
         
         This method is decorated with @retry_with_backoff which provides:
         - Up to 5 retry attempts
-        - Exponential backoff (1s, 2s, 4s, 8s, 16s...)
+        - Exponential backoff with jitter (~1s, 2s, 4s, 8s, 16s...)
         - Only retries on AIServiceError
         
         Args:
@@ -251,9 +372,16 @@ class CallProcessor:
         return {
             "is_running": self.is_running,
             "processed_count": self.processed_count,
+            "empty_calls_skipped": self.empty_calls_skipped,
+            "circuit_breaker": self._breaker.get_stats(),
             "ai_service_stats": ai_service.get_stats()
         }
 
 
 # Global processor instance
-call_processor = CallProcessor(poll_interval=5)
\ No newline at end of file
+call_processor = CallProcessor(
+    poll_interval=settings.CALL_PROCESSOR_POLL_INTERVAL,
+    batch_size=settings.CALL_PROCESSOR_BATCH_SIZE,
+    max_concurrency=settings.CALL_PROCESSOR_MAX_CONCURRENCY,
+    lease_seconds=settings.CALL_PROCESSOR_LEASE_SECONDS
+)
\ No newline at end of file
@@ -1,22 +1,139 @@
 """
 Call Service - Business Logic for Call Management
 """
-from datetime import datetime
-from typing import Optional, List
-from sqlalchemy import select, and_
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import NamedTuple, Optional, List, Tuple, Union
+from sqlalchemy import select, insert, update, and_, or_, bindparam, func, inspect, literal, literal_column, text, Integer, RowMapping
+from sqlalchemy.dialects.postgresql import ARRAY, aggregate_order_by, insert as pg_insert
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.exc import IntegrityError
 
-from app.db.models import Call, CallPacket, CallStatus
+from app.config import settings
+from app.db.models import Call, CallPacket, CallStatus, utc_now
 from app.services.state_machine import CallStateMachine, StateTransitionError
 from app.utils.logger import setup_logger
 
 logger = setup_logger(__name__)
 
+# NOTIFY channel announcing calls that are ready for AI processing
+CALL_READY_CHANNEL = "call_ready"
+
+# Per-call UPDATE applied after a packet batch (run as executemany).
+# Gaps are appended and filled gaps removed inside Postgres, and the packet
+# count is incremented in place, so neither round-trips through Python.
+# updated_at comes from the column's server-side onupdate.
+_UPDATE_CALL_AFTER_PACKETS = (
+    update(Call.__table__)
+    .where(Call.__table__.c.id == bindparam("b_id"))
+    .values(
+        expected_sequence=bindparam("b_expected_sequence"),
+        total_packets=Call.__table__.c.total_packets + bindparam("b_added_packets"),
+        missing_packets=text(
+            "ARRAY(SELECT m FROM unnest(calls.missing_packets || :added) AS m "
+            "WHERE m <> ALL(:filled))"
+        ).bindparams(
+            bindparam("added", type_=ARRAY(Integer)),
+            bindparam("filled", type_=ARRAY(Integer))
+        )
+    )
+)
+
+
+class PendingPacket(NamedTuple):
+    """Packet accepted by the API and waiting to be written"""
+    call_id: str
+    sequence: int
+    data: str
+    timestamp: float
+
+
+# Columns returned by the call history listing (CallResponse fields)
+_CALL_LIST_COLUMNS = (
+    Call.id,
+    Call.call_id,
+    Call.status,
+    Call.created_at,
+    Call.updated_at,
+    Call.completed_at,
+    Call.total_packets,
+    Call.missing_packets,
+    Call.transcription,
+    Call.sentiment,
+    Call.ai_processed_at,
+    Call.error_message
+)
+
+
+class PacketReceipt(NamedTuple):
+    """Result of storing a packet"""
+    packet_id: int
+    received_at: datetime
+    is_in_order: bool
+
 
 class CallService:
     """Service for managing calls and packets"""
     
+    # Known calls for packet ingestion: {call_id: (pk, cached_at monotonic)},
+    # oldest first, so the front is always the next entry to expire
+    _CALL_PK_CACHE_MAX = 65536
+    _call_pk_cache: "OrderedDict[str, Tuple[int, float]]" = OrderedDict()
+    
+    @staticmethod
+    async def ensure_call(
+        db: AsyncSession,
+        call_id: str
+    ) -> int:
+        """
+        Make sure a call exists and return its primary key
+        
+        Streaming calls send many packets, so the pk is cached for
+        CALL_CACHE_TTL seconds and repeat packets skip the database. The
+        cache holds at most _CALL_PK_CACHE_MAX calls; expired entries are
+        dropped on every miss, so calls finished elsewhere or abandoned
+        don't linger.
+        
+        Args:
+            db: Database session
+            call_id: Unique call identifier
+            
+        Returns:
+            Primary key of the call
+        """
+        cache = CallService._call_pk_cache
+        now = time.monotonic()
+        cached = cache.get(call_id)
+        if cached is not None and now - cached[1] < settings.CALL_CACHE_TTL:
+            return cached[0]
+        
+        # Miss: sweep expired entries from the front
+        while cache:
+            oldest = next(iter(cache.values()))
+            if now - oldest[1] < settings.CALL_CACHE_TTL:
+                break
+            cache.popitem(last=False)
+        
+        call = await CallService.get_or_create_call(db, call_id)
+        cache[call_id] = (call.id, time.monotonic())
+        cache.move_to_end(call_id)
+        if len(cache) > CallService._CALL_PK_CACHE_MAX:
+            cache.popitem(last=False)
+        return call.id
+    
+    @staticmethod
+    def invalidate_call_cache(call_id: Optional[str] = None):
+        """
+        Drop cached call pks
+        
+        Args:
+            call_id: Call to forget, or None to clear the whole cache
+        """
+        if call_id is None:
+            CallService._call_pk_cache.clear()
+        else:
+            CallService._call_pk_cache.pop(call_id, None)
+    
     @staticmethod
     async def get_or_create_call(
         db: AsyncSession, 
@@ -25,6 +142,10 @@ class CallService:
         """
         Get existing call or create new one
         
+        A single INSERT ... ON CONFLICT (call_id) DO UPDATE ... RETURNING,
+        so there is no lookup round-trip and concurrent first packets for
+        the same call cannot race each other into an IntegrityError.
+        
         Args:
             db: Database session
             call_id: Unique call identifier
@@ -32,93 +153,175 @@ class CallService:
         Returns:
             Call object
         """
-        # Try to find existing call
-        result = await db.execute(
-            select(Call).where(Call.call_id == call_id)
-        )
-        call = result.scalar_one_or_none()
-        
-        if not call:
-            # Create new call
-            call = Call(
+        stmt = (
+            pg_insert(Call)
+            .values(
                 call_id=call_id,
                 status=CallStatus.IN_PROGRESS,
                 expected_sequence=0,
                 total_packets=0
             )
-            db.add(call)
-            await db.commit()
-            await db.refresh(call)
-            logger.info(f"Created new call: {call_id}")
+            .on_conflict_do_update(
+                index_elements=[Call.call_id],
+                set_={"updated_at": utc_now()}
+            )
+            # xmax is 0 only on a freshly inserted row version
+            .returning(Call, literal_column("xmax = 0").label("inserted"))
+            .execution_options(populate_existing=True)
+        )
+        call, inserted = (await db.execute(stmt)).one()
+        await db.commit()
         
+        if inserted:
+            logger.info("Created new call: %s", call_id)
         return call
     
     @staticmethod
-    async def add_packet(
+    async def add_packets(
         db: AsyncSession,
-        call: Call,
-        sequence: int,
-        data: str,
-        timestamp: float
-    ) -> tuple[CallPacket, bool]:
+        packets: List[PendingPacket]
+    ) -> List[Union[PacketReceipt, Exception]]:
         """
-        Add packet to call and validate sequence
+        Add a batch of packets and validate their sequences
+        
+        Packets are applied in the order given, so the result for each one
+        matches what per-packet ingestion would have produced. The expected
+        sequence is read from calls.expected_sequence in the same statement
+        that locks the call row. Under READ COMMITTED a statement that had
+        to wait for the lock sees the latest version of the locked row, so
+        packets committed by another worker in the meantime are accounted
+        for (a subquery over call_packets would still use the statement's
+        original snapshot). All packet rows go out in a single Core
+        multi-row INSERT ... RETURNING (no ORM unit of work) and every
+        touched call is updated in a single executemany UPDATE, followed by
+        one commit.
         
         Args:
             db: Database session
-            call: Call object
-            sequence: Packet sequence number
-            data: Packet data
-            timestamp: Packet timestamp
+            packets: Packets to store, in arrival order
             
         Returns:
-            Tuple of (CallPacket, is_in_order: bool)
-        """
-        is_in_order = True
-        
-        # Check if packet is in expected sequence
-        if sequence != call.expected_sequence:
-            is_in_order = False
-            
-            # Log missing packets
-            if sequence > call.expected_sequence:
-                missing = list(range(call.expected_sequence, sequence))
-                logger.warning(
-                    f"Call {call.call_id}: Missing packets {missing}. "
-                    f"Expected {call.expected_sequence}, got {sequence}"
-                )
-                
-                # Update missing packets list
-                current_missing = set()
-                if call.missing_packets:
-                    current_missing = set(map(int, call.missing_packets.split(',')))
-                current_missing.update(missing)
-                call.missing_packets = ','.join(map(str, sorted(current_missing)))
-            else:
-                logger.warning(
-                    f"Call {call.call_id}: Duplicate or out-of-order packet. "
-                    f"Expected {call.expected_sequence}, got {sequence}"
-                )
-        
-        # Create packet
-        packet = CallPacket(
-            call_id=call.call_id,
-            sequence=sequence,
-            data=data,
-            timestamp=timestamp
+            One entry per packet: a PacketReceipt, or an exception if the
+            packet's call does not exist
+        """
+        call_ids = {p.call_id for p in packets}
+        
+        # Lock the call rows so concurrent workers serialize per call
+        result = await db.execute(
+            select(Call.id, Call.call_id, Call.expected_sequence)
+            .where(Call.call_id.in_(call_ids))
+            .with_for_update()
         )
-        db.add(packet)
+        calls = {
+            row.call_id: {
+                "id": row.id,
+                "call_id": row.call_id,
+                "added_packets": 0,
+                "expected_sequence": row.expected_sequence,
+                "missing_added": [],
+                "missing_filled": []
+            }
+            for row in result
+        }
         
-        # Update call
-        call.total_packets += 1
-        if sequence >= call.expected_sequence:
-            call.expected_sequence = sequence + 1
-        call.updated_at = datetime.utcnow()
+        packet_rows = []
+        in_order_flags = []
+        touched = {}
+        outcomes: List[Union[PacketReceipt, Exception, None]] = []
         
-        await db.commit()
-        await db.refresh(packet)
+        for packet in packets:
+            call = calls.get(packet.call_id)
+            if call is None:
+                outcomes.append(LookupError(f"Call {packet.call_id} not found"))
+                continue
+            
+            is_in_order = CallService._check_sequence(call, packet.sequence)
+            
+            call["added_packets"] += 1
+            if packet.sequence >= call["expected_sequence"]:
+                call["expected_sequence"] = packet.sequence + 1
+            touched[call["id"]] = call
+            
+            packet_rows.append({
+                "call_id": packet.call_id,
+                "sequence": packet.sequence,
+                "data": packet.data,
+                "timestamp": packet.timestamp
+            })
+            in_order_flags.append((len(outcomes), is_in_order))
+            outcomes.append(None)  # Filled from RETURNING below
+        
+        if packet_rows:
+            result = await db.execute(
+                insert(CallPacket).returning(
+                    CallPacket.id,
+                    CallPacket.received_at,
+                    sort_by_parameter_order=True
+                ),
+                packet_rows
+            )
+            for (index, is_in_order), row in zip(in_order_flags, result.all()):
+                outcomes[index] = PacketReceipt(row.id, row.received_at, is_in_order)
+            
+            await db.execute(
+                _UPDATE_CALL_AFTER_PACKETS,
+                [
+                    {
+                        "b_id": call["id"],
+                        "b_expected_sequence": call["expected_sequence"],
+                        "b_added_packets": call["added_packets"],
+                        "added": call["missing_added"],
+                        "filled": call["missing_filled"]
+                    }
+                    for call in touched.values()
+                ]
+            )
+            await db.commit()
+        
+        return outcomes
+    
+    @staticmethod
+    def _check_sequence(call: dict, sequence: int) -> bool:
+        """
+        Compare a packet's sequence with the call's expected sequence
+        
+        Logs gaps and duplicates. Newly detected gaps are collected in
+        call["missing_added"]; late packets that may fill an earlier gap
+        are collected in call["missing_filled"].
+        
+        Args:
+            call: Per-call batch state (expected_sequence, missing_added, ...)
+            sequence: Packet sequence number
+            
+        Returns:
+            True if the packet is the next one expected
+        """
+        expected = call["expected_sequence"]
+        if sequence == expected:
+            return True
         
-        return packet, is_in_order
+        # Log missing packets
+        if sequence > expected:
+            missing = list(range(expected, sequence))
+            logger.warning(
+                "Call %s: Missing packets %s. Expected %d, got %d",
+                call["call_id"], missing, expected, sequence
+            )
+            
+            call["missing_added"].extend(missing)
+        else:
+            logger.warning(
+                "Call %s: Duplicate or out-of-order packet. Expected %d, got %d",
+                call["call_id"], expected, sequence
+            )
+            
+            # A late packet fills its gap (no-op if it was never missing)
+            if sequence in call["missing_added"]:
+                call["missing_added"].remove(sequence)
+            else:
+                call["missing_filled"].append(sequence)
+        
+        return False
     
     @staticmethod
     async def update_call_status(
@@ -139,6 +342,50 @@ class CallService:
         Returns:
             Updated call object
             
+        Raises:
+            StateTransitionError: If transition is invalid
+        """
+        old_status = CallService.apply_status(call, new_status, error_message)
+        
+        if old_status == CallStatus.IN_PROGRESS and new_status == CallStatus.COMPLETED:
+            # Wake the call processor; delivered only if this transaction commits
+            await db.execute(
+                select(func.pg_notify(CALL_READY_CHANNEL, call.call_id))
+            )
+        
+        await db.commit()
+        
+        # The session doesn't expire on commit; only attributes assigned a
+        # SQL expression (completed_at) still need loading, so fetch just
+        # those instead of the whole row
+        expired = inspect(call).expired_attributes
+        if expired:
+            await db.refresh(call, attribute_names=list(expired))
+        
+        return call
+    
+    @staticmethod
+    def apply_status(
+        call: Call,
+        new_status: CallStatus,
+        error_message: Optional[str] = None
+    ) -> CallStatus:
+        """
+        Validate and apply a status change on the object without committing
+        
+        Lets callers fold the status change into the same commit as other
+        field updates. Timestamps are generated by the database: updated_at
+        comes back via RETURNING on flush, while completed_at is assigned
+        as SQL and stays expired until the row is reloaded.
+        
+        Args:
+            call: Call object
+            new_status: Desired new status
+            error_message: Optional error message if transitioning to FAILED
+            
+        Returns:
+            The previous status
+            
         Raises:
             StateTransitionError: If transition is invalid
         """
@@ -146,69 +393,199 @@ class CallService:
         old_status = call.status
         CallStateMachine.transition(old_status, new_status)
         
-        # Update status
+        # Update status (updated_at is set by the database on flush)
         call.status = new_status
-        call.updated_at = datetime.utcnow()
         
         if new_status == CallStatus.COMPLETED:
-            call.completed_at = datetime.utcnow()
+            call.completed_at = utc_now()
         
         if new_status == CallStatus.FAILED and error_message:
             call.error_message = error_message
         
-        await db.commit()
-        await db.refresh(call)
+        if new_status in (CallStatus.COMPLETED, CallStatus.FAILED):
+            CallService.invalidate_call_cache(call.call_id)
         
-        logger.info(f"Call {call.call_id}: Status changed {old_status.value} → {new_status.value}")
+        logger.info(
+            "Call %s: Status changed %s → %s",
+            call.call_id, old_status.value, new_status.value
+        )
         
-        return call
+        return old_status
     
     @staticmethod
     async def get_call_by_id(
         db: AsyncSession,
-        call_id: str
-    ) -> Optional[Call]:
-        """Get call by call_id with packets loaded"""
-        from sqlalchemy.orm import selectinload
+        call_id: str,
+        with_packet_count: bool = False
+    ) -> Union[Optional[Call], Optional[Tuple[Call, int]]]:
+        """
+        Get call by call_id
+        
+        Packets are not loaded. When with_packet_count is True the number
+        of stored packets is computed with a COUNT in the same query.
+        
+        Args:
+            db: Database session
+            call_id: Unique call identifier
+            with_packet_count: Also return the stored packet count
+            
+        Returns:
+            Call object, or (Call, packets_count) if with_packet_count;
+            None if the call does not exist
+        """
+        if not with_packet_count:
+            result = await db.execute(
+                select(Call).where(Call.call_id == call_id)
+            )
+            return result.scalar_one_or_none()
         
         result = await db.execute(
-            select(Call)
-            .options(selectinload(Call.packets))
+            select(Call, func.count(CallPacket.id))
+            .outerjoin(CallPacket, CallPacket.call_id == Call.call_id)
             .where(Call.call_id == call_id)
+            .group_by(Call.id)
         )
-        return result.scalar_one_or_none()
+        row = result.one_or_none()
+        if row is None:
+            return None
+        return row[0], row[1]
     
     @staticmethod
     async def get_all_calls(
         db: AsyncSession,
         status: Optional[CallStatus] = None,
         limit: int = 100
-    ) -> List[Call]:
+    ) -> List[RowMapping]:
         """
         Get all calls with optional status filter
         
+        Selects only the columns the history view returns, as plain rows:
+        no ORM objects or identity-map entries are built for what is a
+        read-only listing.
+        
         Args:
             db: Database session
             status: Optional status filter
             limit: Maximum number of results
             
         Returns:
-            List of Call objects
+            List of column-name -> value mappings, newest first
         """
-        query = select(Call).order_by(Call.updated_at.desc()).limit(limit)
+        query = select(*_CALL_LIST_COLUMNS).order_by(Call.updated_at.desc()).limit(limit)
         
         if status:
             query = query.where(Call.status == status)
         
         result = await db.execute(query)
-        return result.scalars().all()
+        return result.mappings().all()
     
     @staticmethod
     async def get_calls_for_processing(
-        db: AsyncSession
+        db: AsyncSession,
+        limit: int = 20,
+        lease_seconds: int = 300
     ) -> List[Call]:
-        """Get calls that are COMPLETED and ready for AI processing"""
+        """
+        Claim a batch of calls that are ready for AI processing
+        
+        Ready calls (COMPLETED, not yet AI-processed) are moved to
+        PROCESSING_AI with a single UPDATE ... RETURNING. The inner
+        SELECT uses FOR UPDATE SKIP LOCKED, so concurrent workers claim
+        disjoint batches. The claimed calls are then loaded in one query;
+        packets are not loaded (see aggregate_packet_data).
+        
+        A claim is a lease: a PROCESSING_AI call not updated for
+        lease_seconds (its worker was cancelled on shutdown or crashed)
+        is ready again.
+        
+        Args:
+            db: Database session
+            limit: Maximum number of calls to claim
+            lease_seconds: Seconds before an unfinished claim can be taken over
+            
+        Returns:
+            Claimed Call objects (status PROCESSING_AI), oldest first
+        """
+        ready = (
+            select(Call.id)
+            .where(
+                or_(
+                    Call.status == CallStatus.COMPLETED,
+                    and_(
+                        Call.status == CallStatus.PROCESSING_AI,
+                        Call.updated_at < utc_now() - timedelta(seconds=lease_seconds)
+                    )
+                ),
+                Call.ai_processed_at.is_(None)
+            )
+            .order_by(Call.updated_at)
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+        )
+        result = await db.execute(
+            update(Call)
+            .where(Call.id.in_(ready.scalar_subquery()))
+            .values(status=CallStatus.PROCESSING_AI)
+            .returning(Call.id)
+            .execution_options(synchronize_session=False)
+        )
+        claimed_ids = result.scalars().all()
+        await db.commit()
+        
+        if not claimed_ids:
+            return []
+        
+        result = await db.execute(
+            select(Call)
+            .where(Call.id.in_(claimed_ids))
+            .order_by(Call.updated_at)
+            .execution_options(populate_existing=True)
+        )
+        return result.scalars().all()
+    
+    @staticmethod
+    async def aggregate_packet_data(
+        db: AsyncSession,
+        call_id: str,
+        max_chars: Optional[int] = None
+    ) -> str:
+        """
+        Join a call's packet data in sequence order, inside Postgres
+        
+        string_agg(data, ' ' ORDER BY sequence) returns one string, so no
+        packet rows are sent to the app or turned into ORM objects. The
+        result is cut to max_chars in SQL, so a very long call never
+        reaches the app (or the AI request) as one unbounded string.
+        
+        Args:
+            db: Database session
+            call_id: Unique call identifier
+            max_chars: Upper bound on the returned length
+                (defaults to settings.AI_MAX_PAYLOAD_CHARS)
+            
+        Returns:
+            Space-separated packet data ("" if the call has no packets)
+        """
+        if max_chars is None:
+            max_chars = settings.AI_MAX_PAYLOAD_CHARS
+        
+        joined = func.coalesce(
+            func.string_agg(
+                CallPacket.data,
+                aggregate_order_by(literal(" "), CallPacket.sequence)
+            ),
+            ""
+        )
         result = await db.execute(
-            select(Call).where(Call.status == CallStatus.COMPLETED)
+            # Postgres evaluates the identical aggregate once for both columns
+            select(func.length(joined), func.left(joined, max_chars))
+            .where(CallPacket.call_id == call_id)
         )
-        return result.scalars().all()
\ No newline at end of file
+        total_chars, data = result.one()
+        
+        if total_chars > max_chars:
+            logger.warning(
+                "Packet data for call %s truncated from %d to %d chars",
+                call_id, total_chars, max_chars
+            )
+        return data
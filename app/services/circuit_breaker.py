@@ -0,0 +1,110 @@
+"""
+Circuit Breaker for the AI Service
+Fails fast while the AI service is down instead of burning retries
+"""
+import time
+
+from app.services.ai_service import AIServiceError
+from app.utils.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+
+class CircuitOpenError(AIServiceError):
+    """Raised when a request is rejected because the circuit is open"""
+    pass
+
+
+class AsyncCircuitBreaker:
+    """
+    Consecutive-failure circuit breaker
+
+    States:
+    closed → open: after failure_threshold consecutive failures
+    open → half_open: once reset_timeout seconds have passed; one probe
+                      request is let through
+    half_open → closed: probe succeeded
+    half_open → open: probe failed
+    
+    A probe that ends without a verdict must be handed back with
+    release_probe(); one that never reports is replaced by a new probe
+    after another reset_timeout.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        """
+        Initialize circuit breaker
+
+        Args:
+            failure_threshold: Consecutive failures that open the circuit
+            reset_timeout: Seconds to stay open before allowing a probe
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failure_count = 0
+        self.opened_at = 0.0
+        self._probe_in_flight = False
+        self._probe_started = 0.0
+
+    def allow_request(self) -> bool:
+        """
+        Check whether a request may go through
+
+        Returns:
+            True if the request may proceed, False to fail fast
+        """
+        if self.state == self.CLOSED:
+            return True
+
+        if self.state == self.OPEN:
+            if time.monotonic() - self.opened_at < self.reset_timeout:
+                return False
+            self.state = self.HALF_OPEN
+            self._probe_in_flight = False
+            logger.info("Circuit half-open, allowing a probe request")
+
+        # Half-open: only one probe at a time (a stale probe is replaced)
+        now = time.monotonic()
+        if self._probe_in_flight and now - self._probe_started < self.reset_timeout:
+            return False
+        self._probe_in_flight = True
+        self._probe_started = now
+        return True
+    
+    def release_probe(self):
+        """Give back a permitted request that ended without a verdict"""
+        self._probe_in_flight = False
+
+    def record_success(self):
+        """Record a successful request (closes the circuit)"""
+        if self.state != self.CLOSED:
+            logger.info("Circuit closed, AI service recovered")
+        self.state = self.CLOSED
+        self.failure_count = 0
+        self._probe_in_flight = False
+
+    def record_failure(self):
+        """Record a failed request (may open the circuit)"""
+        self.failure_count += 1
+        self._probe_in_flight = False
+
+        if self.state == self.HALF_OPEN or self.failure_count >= self.failure_threshold:
+            if self.state != self.OPEN:
+                logger.warning(
+                    "Circuit opened after %d consecutive failures; failing fast for %ss",
+                    self.failure_count, self.reset_timeout
+                )
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+
+    def get_stats(self) -> dict:
+        """Get circuit breaker statistics"""
+        return {
+            "state": self.state,
+            "failure_count": self.failure_count
+        }
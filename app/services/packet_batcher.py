@@ -0,0 +1,212 @@
+"""
+Packet Batcher - Coalesces packet writes from concurrent requests
+Turns N per-request INSERT + UPDATE + COMMIT round-trips into one batch
+"""
+import asyncio
+from typing import List, Optional
+from sqlalchemy import text
+from sqlalchemy.exc import InterfaceError, OperationalError
+
+from app.config import settings
+from app.db.database import AsyncSessionLocal
+from app.services.call_service import CallService, PacketReceipt, PendingPacket
+from app.utils.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+
+class _QueuedPacket:
+    """Packet plus the future its request is waiting on"""
+    __slots__ = ("packet", "future")
+    
+    def __init__(self, packet: PendingPacket, future: asyncio.Future):
+        self.packet = packet
+        self.future = future
+
+
+def _is_connection_error(exc: Exception) -> bool:
+    """True if exc means the database itself is unreachable, not one bad row"""
+    return (
+        isinstance(exc, (OSError, asyncio.TimeoutError, InterfaceError, OperationalError))
+        or getattr(exc, "connection_invalidated", False)
+    )
+
+
+class PacketBatcher:
+    """
+    Collects packets into batches and writes each batch in one transaction
+    
+    Workflow:
+    1. Request handlers submit a packet and await the returned future
+    2. A background task waits up to max_delay for more packets, or until
+       max_batch_size packets are queued, whichever comes first
+    3. The batch is written with CallService.add_packets
+    4. Every future in the batch is resolved once the batch has committed
+    5. If the batch fails, it is retried per call and then per packet, so
+       one bad packet fails only its own request
+    """
+    
+    def __init__(
+        self,
+        max_batch_size: int = 500,
+        max_delay: float = 0.01,
+        session_factory=AsyncSessionLocal
+    ):
+        """
+        Initialize packet batcher
+        
+        Args:
+            max_batch_size: Maximum packets written per transaction (default: 500)
+            max_delay: Seconds to wait for a batch to fill (default: 0.01)
+            session_factory: Callable returning an AsyncSession
+        """
+        self.max_batch_size = max_batch_size
+        self.max_delay = max_delay
+        self.session_factory = session_factory
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+    
+    def submit(
+        self,
+        call_id: str,
+        sequence: int,
+        data: str,
+        timestamp: float
+    ) -> "asyncio.Future[PacketReceipt]":
+        """
+        Queue a packet for the next batch
+        
+        Args:
+            call_id: Unique call identifier (call must already exist)
+            sequence: Packet sequence number
+            data: Packet data
+            timestamp: Packet timestamp
+            
+        Returns:
+            Future resolved with a PacketReceipt once the packet's batch
+            has been committed
+        """
+        self._ensure_started()
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait(
+            _QueuedPacket(PendingPacket(call_id, sequence, data, timestamp), future)
+        )
+        return future
+    
+    @property
+    def depth(self) -> int:
+        """Packets queued but not yet picked up for a batch"""
+        return self._queue.qsize() if self._queue is not None else 0
+    
+    async def stop(self):
+        """Flush queued packets and stop the background task"""
+        if self._task is None or self._task.done():
+            return
+        if self._task.get_loop() is not asyncio.get_running_loop():
+            self._task = None
+            return
+        
+        self._queue.put_nowait(None)
+        await self._task
+        self._task = None
+    
+    def _ensure_started(self):
+        """Start the flusher task on the current event loop if needed"""
+        loop = asyncio.get_running_loop()
+        if (
+            self._task is None
+            or self._task.done()
+            or self._task.get_loop() is not loop
+        ):
+            self._queue = asyncio.Queue()
+            self._task = loop.create_task(self._run())
+    
+    async def _run(self):
+        """Drain the queue in batches until a stop sentinel arrives"""
+        queue = self._queue
+        stopping = False
+        
+        while not stopping:
+            first = await queue.get()
+            if first is None:
+                break
+            
+            # Give concurrent requests up to max_delay to join this batch,
+            # but flush as soon as it is full
+            loop = asyncio.get_running_loop()
+            deadline = loop.time() + self.max_delay
+            batch: List[_QueuedPacket] = [first]
+            
+            while len(batch) < self.max_batch_size:
+                if queue.empty():
+                    remaining = deadline - loop.time()
+                    if remaining <= 0:
+                        break
+                    try:
+                        item = await asyncio.wait_for(queue.get(), remaining)
+                    except asyncio.TimeoutError:
+                        break
+                else:
+                    item = queue.get_nowait()
+                
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            
+            await self._flush(batch)
+    
+    async def _flush(self, batch: List[_QueuedPacket]):
+        """
+        Write one batch and resolve its futures
+        
+        A failed batch is split and retried: first into one transaction per
+        call, then a failing call into one transaction per packet. Errors
+        that mean the database is unreachable fail the batch as a whole.
+        
+        Args:
+            batch: Queued packets to write
+        """
+        try:
+            async with self.session_factory() as db:
+                if settings.PACKET_ASYNC_COMMIT:
+                    # Don't wait for the WAL flush; a crash can lose the
+                    # last few hundred ms of acknowledged packets
+                    await db.execute(text("SET LOCAL synchronous_commit = off"))
+                outcomes = await CallService.add_packets(
+                    db, [item.packet for item in batch]
+                )
+        except Exception as e:
+            if len(batch) > 1 and not _is_connection_error(e):
+                logger.warning(
+                    "Batch of %d packets failed, retrying in smaller batches: %s",
+                    len(batch), e
+                )
+                by_call = {}
+                for item in batch:
+                    by_call.setdefault(item.packet.call_id, []).append(item)
+                groups = by_call.values() if len(by_call) > 1 else ([item] for item in batch)
+                for group in groups:
+                    await self._flush(group)
+                return
+            
+            logger.error("Failed to write batch of %d packets: %s", len(batch), e)
+            for item in batch:
+                if not item.future.done():
+                    item.future.set_exception(e)
+            return
+        
+        for item, outcome in zip(batch, outcomes):
+            if item.future.done():
+                continue
+            if isinstance(outcome, Exception):
+                item.future.set_exception(outcome)
+            else:
+                item.future.set_result(outcome)
+
+
+# Global batcher instance
+packet_batcher = PacketBatcher(
+    max_batch_size=settings.PACKET_BATCH_MAX_SIZE,
+    max_delay=settings.PACKET_BATCH_MAX_DELAY
+)
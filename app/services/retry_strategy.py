@@ -5,7 +5,7 @@ Uses Tenacity library for robust retry logic
 from tenacity import (
     retry,
     stop_after_attempt,
-    wait_exponential,
+    wait_exponential_jitter,
     retry_if_exception_type,
     before_sleep_log,
     after_log
@@ -24,23 +24,28 @@ def create_retry_decorator():
     
     Configuration:
     - Max attempts: 5 (from settings.MAX_RETRY_ATTEMPTS)
-    - Wait: Exponential backoff starting at 1s, max 60s
+    - Wait: Exponential backoff starting at 1s, max 60s, plus up to 1s of
+      random jitter so concurrent calls don't retry in lockstep
     - Retry on: AIServiceError only
     - Logging: Before each retry and after final attempt
+    - The last AIServiceError is re-raised once attempts are exhausted
     """
     return retry(
         # Stop after max attempts
         stop=stop_after_attempt(settings.MAX_RETRY_ATTEMPTS),
         
-        # Exponential backoff: 2^x seconds (1, 2, 4, 8, 16...)
-        wait=wait_exponential(
-            multiplier=settings.RETRY_INITIAL_WAIT,
+        # Exponential backoff: 2^x seconds (1, 2, 4, 8, 16...) + jitter
+        wait=wait_exponential_jitter(
+            initial=settings.RETRY_INITIAL_WAIT,
             max=settings.RETRY_MAX_WAIT
         ),
         
         # Only retry on AIServiceError
         retry=retry_if_exception_type(AIServiceError),
         
+        # Surface the AIServiceError itself rather than tenacity's RetryError
+        reraise=True,
+        
         # Log before each retry
         before_sleep=before_sleep_log(logger, logging.WARNING),
         
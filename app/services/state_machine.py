@@ -3,7 +3,7 @@ Call State Machine Implementation
 Manages valid state transitions for Call objects
 """
 from enum import Enum
-from typing import Dict, Set
+from typing import Dict, FrozenSet, Tuple
 from app.db.models import CallStatus
 
 
@@ -27,26 +27,33 @@ class CallStateMachine:
     """
     
     # Define valid state transitions
-    VALID_TRANSITIONS: Dict[CallStatus, Set[CallStatus]] = {
-        CallStatus.IN_PROGRESS: {
+    VALID_TRANSITIONS: Dict[CallStatus, FrozenSet[CallStatus]] = {
+        CallStatus.IN_PROGRESS: frozenset({
             CallStatus.COMPLETED,
             CallStatus.FAILED
-        },
-        CallStatus.COMPLETED: {
+        }),
+        CallStatus.COMPLETED: frozenset({
             CallStatus.PROCESSING_AI,
             CallStatus.ARCHIVED
-        },
-        CallStatus.PROCESSING_AI: {
+        }),
+        CallStatus.PROCESSING_AI: frozenset({
             CallStatus.COMPLETED,  # For retry scenarios
             CallStatus.FAILED,
             CallStatus.ARCHIVED
-        },
-        CallStatus.FAILED: {
+        }),
+        CallStatus.FAILED: frozenset({
             CallStatus.ARCHIVED
-        },
-        CallStatus.ARCHIVED: set()  # Terminal state
+        }),
+        CallStatus.ARCHIVED: frozenset()  # Terminal state
     }
     
+    # Flattened (from, to) pairs, including staying in the same state,
+    # so a transition check is a single hash lookup
+    _ALLOWED: FrozenSet[Tuple[CallStatus, CallStatus]] = frozenset(
+        {(f, t) for f, ts in VALID_TRANSITIONS.items() for t in ts}
+        | {(s, s) for s in CallStatus}
+    )
+    
     @classmethod
     def can_transition(cls, from_status: CallStatus, to_status: CallStatus) -> bool:
         """
@@ -59,7 +66,7 @@ class CallStateMachine:
         Returns:
             True if transition is valid, False otherwise
         """
-        return to_status in cls.VALID_TRANSITIONS.get(from_status, set())
+        return to_status in cls.VALID_TRANSITIONS.get(from_status, frozenset())
     
     @classmethod
     def transition(cls, from_status: CallStatus, to_status: CallStatus) -> CallStatus:
@@ -76,18 +83,15 @@ class CallStateMachine:
         Raises:
             StateTransitionError: If transition is invalid
         """
-        # Allow staying in the same state (idempotent)
-        if from_status == to_status:
-            return to_status
-
-        if not cls.can_transition(from_status, to_status):
+        # Staying in the same state is allowed (idempotent)
+        if (from_status, to_status) not in cls._ALLOWED:
             raise StateTransitionError(
                 f"Invalid state transition: {from_status.value} → {to_status.value}"
             )
         return to_status
     
     @classmethod
-    def get_valid_transitions(cls, from_status: CallStatus) -> Set[CallStatus]:
+    def get_valid_transitions(cls, from_status: CallStatus) -> FrozenSet[CallStatus]:
         """
         Get all valid transitions from a given status
         
@@ -97,4 +101,4 @@ class CallStateMachine:
         Returns:
             Set of valid next statuses
         """
-        return cls.VALID_TRANSITIONS.get(from_status, set())
\ No newline at end of file
+        return cls.VALID_TRANSITIONS.get(from_status, frozenset())
\ No newline at end of file
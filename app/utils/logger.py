@@ -1,38 +1,71 @@
 """
 Logging Configuration
 """
+import atexit
 import logging
+import queue
 import sys
-from datetime import datetime
+from functools import cache
+from logging.handlers import QueueHandler, QueueListener
+from typing import Optional
 
+from app.config import settings
 
+# Records from every logger go through this queue; a listener thread does
+# the stdout writes so a slow terminal or pipe never blocks the event loop
+_log_queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+_listener: Optional[QueueListener] = None
+
+# Applied to both the loggers and the stdout handler
+_LOG_LEVEL = settings.LOG_LEVEL.upper()
+
+
+def _start_listener():
+    """Start the shared stdout listener thread (once per process)"""
+    global _listener
+    if _listener is not None:
+        return
+    
+    # Create console handler with formatting
+    handler = logging.StreamHandler(sys.stdout)
+    handler.setLevel(_LOG_LEVEL)
+    
+    # Format: [2026-02-03 10:30:45] INFO - module_name - Message
+    formatter = logging.Formatter(
+        '[%(asctime)s] %(levelname)s - %(name)s - %(message)s',
+        datefmt='%Y-%m-%d %H:%M:%S'
+    )
+    handler.setFormatter(formatter)
+    
+    _listener = QueueListener(_log_queue, handler, respect_handler_level=True)
+    _listener.start()
+    # Flush whatever is still queued on interpreter exit
+    atexit.register(_listener.stop)
+
+
+@cache
 def setup_logger(name: str) -> logging.Logger:
     """
     Configure and return a logger instance
     
+    Memoized, so each name is configured once per process.
+    
     Args:
         name: Logger name (usually __name__ from calling module)
         
     Returns:
         Configured logger instance
     """
+    _start_listener()
+    
     logger = logging.getLogger(name)
-    logger.setLevel(logging.INFO)
+    logger.setLevel(_LOG_LEVEL)
+    # Our handler already emits the record; don't hand it to root as well
+    logger.propagate = False
     
     # Avoid duplicate handlers
     if logger.handlers:
         return logger
     
-    # Create console handler with formatting
-    handler = logging.StreamHandler(sys.stdout)
-    handler.setLevel(logging.INFO)
-    
-    # Format: [2026-02-03 10:30:45] INFO - module_name - Message
-    formatter = logging.Formatter(
-        '[%(asctime)s] %(levelname)s - %(name)s - %(message)s',
-        datefmt='%Y-%m-%d %H:%M:%S'
-    )
-    handler.setFormatter(formatter)
-    
-    logger.addHandler(handler)
-    return logger
\ No newline at end of file
+    logger.addHandler(QueueHandler(_log_queue))
+    return logger
@@ -0,0 +1,97 @@
+"""
+Circuit Breaker Tests
+Tests state transitions of the AI service circuit breaker
+"""
+import pytest
+
+from app.services import circuit_breaker as cb
+from app.services.call_processor import CallProcessor
+from app.services.circuit_breaker import AsyncCircuitBreaker
+
+
+def test_opens_after_consecutive_failures():
+    """Circuit opens after failure_threshold consecutive failures"""
+    breaker = AsyncCircuitBreaker(failure_threshold=3, reset_timeout=30)
+
+    for _ in range(2):
+        assert breaker.allow_request()
+        breaker.record_failure()
+    assert breaker.state == AsyncCircuitBreaker.CLOSED
+
+    # A success resets the streak
+    breaker.record_success()
+    for _ in range(3):
+        breaker.record_failure()
+
+    assert breaker.state == AsyncCircuitBreaker.OPEN
+    assert not breaker.allow_request()
+
+
+def test_half_open_probe(monkeypatch):
+    """After reset_timeout one probe is allowed; its outcome decides the state"""
+    now = [1000.0]
+    monkeypatch.setattr(cb.time, "monotonic", lambda: now[0])
+
+    breaker = AsyncCircuitBreaker(failure_threshold=1, reset_timeout=30)
+    breaker.record_failure()
+    assert not breaker.allow_request()
+
+    # Cooldown elapsed: exactly one probe goes through
+    now[0] += 30
+    assert breaker.allow_request()
+    assert breaker.state == AsyncCircuitBreaker.HALF_OPEN
+    assert not breaker.allow_request()
+
+    # Failed probe re-opens the circuit
+    breaker.record_failure()
+    assert breaker.state == AsyncCircuitBreaker.OPEN
+    assert not breaker.allow_request()
+
+    # Successful probe closes it
+    now[0] += 30
+    assert breaker.allow_request()
+    breaker.record_success()
+    assert breaker.state == AsyncCircuitBreaker.CLOSED
+    assert breaker.allow_request()
+
+
+def test_stale_probe_is_replaced(monkeypatch):
+    """A half-open probe that never reports back doesn't block the circuit forever"""
+    now = [1000.0]
+    monkeypatch.setattr(cb.time, "monotonic", lambda: now[0])
+    
+    breaker = AsyncCircuitBreaker(failure_threshold=1, reset_timeout=30)
+    breaker.record_failure()
+    now[0] += 30
+    assert breaker.allow_request()
+    assert not breaker.allow_request()
+    
+    # The probe never reported; after another reset_timeout a new one goes out
+    now[0] += 30
+    assert breaker.allow_request()
+
+
+@pytest.mark.asyncio
+async def test_unexpected_probe_error_releases_probe(monkeypatch):
+    """A probe failing with a non-AI error frees the probe slot"""
+    now = [1000.0]
+    monkeypatch.setattr(cb.time, "monotonic", lambda: now[0])
+    
+    processor = CallProcessor()
+    breaker = processor._breaker
+    for _ in range(breaker.failure_threshold):
+        breaker.record_failure()
+    now[0] += breaker.reset_timeout
+    
+    async def broken(call_id, audio_data):
+        raise RuntimeError("bug")
+    
+    monkeypatch.setattr(processor, "_process_with_retry", broken)
+    
+    assert breaker.allow_request()
+    with pytest.raises(RuntimeError):
+        await processor._call_ai_service("CALL-1", "data")
+    
+    # Still half-open, but the next call may probe
+    assert breaker.state == AsyncCircuitBreaker.HALF_OPEN
+    assert breaker.allow_request()
@@ -16,20 +16,24 @@ async def test_health_check(client: AsyncClient):
 
 
 @pytest.mark.asyncio
-async def test_packet_ingestion_sequential(client: AsyncClient):
+async def test_packet_ingestion_sequential(client: AsyncClient, query_counter):
     """Test sequential packet ingestion"""
     call_id = "TEST-CALL-001"
     
     # Send packets in order
     for i in range(5):
-        response = await client.post(
-            f"/v1/call/stream/{call_id}",
-            json={
-                "sequence": i,
-                "data": f"packet_{i}",
-                "timestamp": 1738512345.0 + i
-            }
-        )
+        with query_counter.measure():
+            response = await client.post(
+                f"/v1/call/stream/{call_id}",
+                json={
+                    "sequence": i,
+                    "data": f"packet_{i}",
+                    "timestamp": 1738512345.0 + i
+                }
+            )
+        # First packet creates the call; later ones only lock, insert, update
+        assert query_counter.total <= (6 if i == 0 else 3), query_counter.report()
+        assert not query_counter.n_plus_one_patterns(), query_counter.report()
         assert response.status_code == 202
         data = response.json()
         assert data["sequence"] == i
@@ -37,7 +41,7 @@ async def test_packet_ingestion_sequential(client: AsyncClient):
 
 
 @pytest.mark.asyncio
-async def test_missing_packet_detection(client: AsyncClient):
+async def test_missing_packet_detection(client: AsyncClient, query_counter):
     """Test that missing packets are detected"""
     call_id = "TEST-CALL-002"
     
@@ -57,8 +61,11 @@ async def test_missing_packet_detection(client: AsyncClient):
     data = response.json()
     assert data["status"] == "accepted_with_warning"
     
-    # Verify call has missing packets recorded
-    response = await client.get(f"/v1/call/{call_id}")
+    # Verify call has missing packets recorded (packet count comes from
+    # the same query, packets are not loaded)
+    with query_counter.measure():
+        response = await client.get(f"/v1/call/{call_id}")
+    assert query_counter.total == 1, query_counter.report()
     assert response.status_code == 200
     call_data = response.json()
     assert "1" in call_data["missing_packets"]
@@ -67,7 +74,51 @@ async def test_missing_packet_detection(client: AsyncClient):
 
 
 @pytest.mark.asyncio
-async def test_call_state_transitions(client: AsyncClient):
+async def test_late_packet_fills_gap(client: AsyncClient):
+    """Test that a late packet is removed from the missing list"""
+    call_id = "TEST-CALL-LATE"
+    
+    # Send 0 and 4 (1, 2, 3 missing), then 2 arrives late
+    for seq in (0, 4, 2):
+        response = await client.post(
+            f"/v1/call/stream/{call_id}",
+            json={"sequence": seq, "data": f"packet_{seq}", "timestamp": 1738512345.0 + seq}
+        )
+        assert response.status_code == 202
+    
+    response = await client.get(f"/v1/call/{call_id}")
+    assert response.status_code == 200
+    assert response.json()["missing_packets"] == "1,3"
+
+
+@pytest.mark.asyncio
+async def test_duplicate_packet_not_stored(client: AsyncClient):
+    """Test that a retried packet is answered as a duplicate and not stored twice"""
+    call_id = "TEST-CALL-DUP"
+    
+    for seq in (0, 1):
+        response = await client.post(
+            f"/v1/call/stream/{call_id}",
+            json={"sequence": seq, "data": f"packet_{seq}", "timestamp": 1738512345.0 + seq}
+        )
+        assert response.status_code == 202
+        assert response.json()["status"] == "accepted"
+    
+    # Client retries packet 1
+    response = await client.post(
+        f"/v1/call/stream/{call_id}",
+        json={"sequence": 1, "data": "packet_1", "timestamp": 1738512346.0}
+    )
+    assert response.status_code == 202
+    assert response.json()["status"] == "duplicate"
+    
+    response = await client.get(f"/v1/call/{call_id}")
+    assert response.status_code == 200
+    assert response.json()["total_packets"] == 2
+
+
+@pytest.mark.asyncio
+async def test_call_state_transitions(client: AsyncClient, query_counter):
     """Test call state machine transitions"""
     call_id = "TEST-CALL-003"
     
@@ -83,18 +134,22 @@ async def test_call_state_transitions(client: AsyncClient):
     assert response.json()["status"] == "IN_PROGRESS"
     
     # Complete call
-    response = await client.post(f"/v1/call/complete/{call_id}")
+    with query_counter.measure():
+        response = await client.post(f"/v1/call/complete/{call_id}")
+    assert query_counter.total <= 4, query_counter.report()
     assert response.status_code == 200
     assert response.json()["status"] == "COMPLETED"
     
-    # Try to complete again (idempotent)
-    response = await client.post(f"/v1/call/complete/{call_id}")
+    # Try to complete again (idempotent, read only)
+    with query_counter.measure():
+        response = await client.post(f"/v1/call/complete/{call_id}")
+    assert query_counter.total == 1, query_counter.report()
     assert response.status_code == 200
     assert response.json()["status"] == "COMPLETED"
 
 
 @pytest.mark.asyncio
-async def test_call_history(client: AsyncClient):
+async def test_call_history(client: AsyncClient, query_counter):
     """Test retrieving call history"""
     # Create multiple calls
     for i in range(3):
@@ -104,8 +159,10 @@ async def test_call_history(client: AsyncClient):
             json={"sequence": 0, "data": "data", "timestamp": 1738512345.0}
         )
     
-    # Get history
-    response = await client.get("/v1/call/history")
+    # Get history: one query no matter how many calls (no lazy loads)
+    with query_counter.measure():
+        response = await client.get("/v1/call/history")
+    assert query_counter.total == 1, query_counter.report()
     assert response.status_code == 200
     data = response.json()
     assert data["total"] >= 3
@@ -129,4 +186,66 @@ async def test_response_time_under_50ms(client: AsyncClient):
     assert response.status_code == 202
     # In production < 50ms, but tests have overhead - allow 200ms
     assert elapsed < 200, f"Response time {elapsed}ms exceeds limit"
-    print(f"Response time: {elapsed:.2f}ms")
\ No newline at end of file
+    print(f"Response time: {elapsed:.2f}ms")
+
+
+@pytest.mark.asyncio
+async def test_write_behind_packet_ingestion(client: AsyncClient, monkeypatch):
+    """With write-behind enabled, packets are acknowledged before they are stored"""
+    from app.config import settings
+    from app.services.packet_batcher import packet_batcher
+    
+    monkeypatch.setattr(settings, "PACKET_WRITE_BEHIND", True)
+    call_id = "TEST-CALL-BUFFERED"
+    
+    for i in range(3):
+        response = await client.post(
+            f"/v1/call/stream/{call_id}",
+            json={"sequence": i, "data": f"packet_{i}", "timestamp": 1738512345.0 + i}
+        )
+        assert response.status_code == 202
+        assert response.headers["X-Buffered"] == "true"
+        assert response.json()["status"] == "buffered"
+    
+    # Flush the buffer; the packets must all have been written. The client
+    # fixture stops the batcher again at teardown; stop() is a no-op once
+    # the flusher task is gone, so the double stop is intended.
+    await packet_batcher.stop()
+    
+    response = await client.get(f"/v1/call/{call_id}")
+    assert response.status_code == 200
+    assert response.json()["total_packets"] == 3
+
+
+@pytest.mark.asyncio
+async def test_stale_processing_claim_is_reclaimed(client: AsyncClient, db_session):
+    """A call stranded in PROCESSING_AI is claimed again once its lease expires"""
+    from datetime import timedelta
+    from sqlalchemy import update
+    from app.db.models import Call, utc_now
+    from app.services.call_service import CallService
+    
+    call_id = "TEST-CALL-LEASE"
+    await client.post(
+        f"/v1/call/stream/{call_id}",
+        json={"sequence": 0, "data": "data", "timestamp": 1738512345.0}
+    )
+    await client.post(f"/v1/call/complete/{call_id}")
+    
+    claimed = await CallService.get_calls_for_processing(db_session, lease_seconds=300)
+    assert [call.call_id for call in claimed] == [call_id]
+    
+    # Still leased: no other worker may take it
+    assert await CallService.get_calls_for_processing(db_session, lease_seconds=300) == []
+    
+    # Its worker died without finishing; the lease runs out
+    await db_session.execute(
+        update(Call)
+        .where(Call.call_id == call_id)
+        .values(updated_at=utc_now() - timedelta(seconds=301))
+    )
+    await db_session.commit()
+    
+    claimed = await CallService.get_calls_for_processing(db_session, lease_seconds=300)
+    assert [call.call_id for call in claimed] == [call_id]
+    assert claimed[0].status == "PROCESSING_AI"
@@ -1,134 +1,242 @@
 """
 Race Condition Tests - Concurrent Packet Arrival
 Tests database locking behavior when multiple packets arrive simultaneously
+
+As in production with FastAPI:
+- Each request gets its own database session via Depends(get_db)
+- Multiple requests can safely run concurrently
+- PostgreSQL handles row-level locking for actual conflicts
 """
 import pytest
 import asyncio
+import orjson
+from collections import Counter
 from httpx import AsyncClient
+from sqlalchemy import select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.db.models import Call, CallPacket
+from app.services.call_service import CallService, PendingPacket
+from app.services.packet_batcher import PacketBatcher
+from tests.conftest import TestSessionLocal
+
+# Every test here runs on the session-wide event loop (see conftest)
+pytestmark = pytest.mark.asyncio
+
+_PAYLOAD_TS = 1738512345.0
+
+
+def _payload(seq: int) -> dict:
+    """Packet body for sequence number seq"""
+    return {"sequence": seq, "data": f"packet_{seq}", "timestamp": _PAYLOAD_TS + seq}
 
 
-@pytest.mark.asyncio
-async def test_concurrent_packet_same_sequence(client: AsyncClient):
+# Bodies are serialized once at import and posted as raw bytes
+_SEQ_PAYLOADS = [orjson.dumps(_payload(seq)) for seq in range(6)]
+_JSON_HEADERS = {"content-type": "application/json"}
+
+
+async def _post_concurrently(client: AsyncClient, call_id: str, bodies) -> list:
     """
-    Test race condition: Two packets with same sequence arriving simultaneously
+    POST every packet body at once
     
-    Demonstrates: When using shared database session in tests, SQLAlchemy
-    properly prevents concurrent access with "session is provisioning" error.
-    In production with separate sessions per request, both would succeed.
-    """
-    call_id = "TEST-RACE-001"
+    Any exception fails the test through the TaskGroup.
     
-    # Send two identical packets concurrently
-    tasks = [
-        client.post(
-            f"/v1/call/stream/{call_id}",
-            json={"sequence": 0, "data": "packet_0_v1", "timestamp": 1738512345.0}
-        ),
-        client.post(
-            f"/v1/call/stream/{call_id}",
-            json={"sequence": 0, "data": "packet_0_v2", "timestamp": 1738512345.0}
+    Args:
+        client: Test client
+        call_id: Call to stream to
+        bodies: Serialized packet bodies
+    
+    Returns:
+        Responses, in the order of bodies
+    """
+    url = f"/v1/call/stream/{call_id}"
+    post = client.post
+    async with asyncio.TaskGroup() as tg:
+        create_task = tg.create_task
+        tasks = [
+            create_task(post(url, content=body, headers=_JSON_HEADERS))
+            for body in bodies
+        ]
+    return [task.result() for task in tasks]
+
+
+async def _get_call(db: AsyncSession, call_id: str) -> Call:
+    """Load a call directly, bypassing the API"""
+    result = await db.execute(select(Call).where(Call.call_id == call_id))
+    return result.scalar_one()
+
+
+async def _wait_for_lock_waiter(db: AsyncSession):
+    """Poll until another backend is waiting on a row lock"""
+    for _ in range(200):
+        waiting = await db.scalar(
+            text(
+                "SELECT count(*) FROM pg_stat_activity "
+                "WHERE wait_event_type = 'Lock' AND datname = current_database()"
+            )
         )
+        await db.commit()
+        if waiting:
+            return
+        await asyncio.sleep(0.01)
+    raise AssertionError("No session ever waited on the call row lock")
+
+
+@pytest.mark.parametrize(
+    "n_concurrent, same_sequence",
+    [
+        (2, True),   # Two packets with the same sequence arriving simultaneously
+        (3, False),  # Consecutive packets arriving out of order
+        (5, True),   # Five simultaneous first packets for a new call
     ]
+)
+async def test_concurrent_stream(
+    client: AsyncClient,
+    db_session: AsyncSession,
+    n_concurrent: int,
+    same_sequence: bool
+):
+    """
+    Every concurrent packet must be accepted: the call is created once
+    (INSERT ... ON CONFLICT) and the packet writes serialize on the call
+    row lock. No crashes, no errors, no data corruption.
     
-    # Execute concurrently
-    responses = await asyncio.gather(*tasks, return_exceptions=True)
-    
-    # At least one should succeed (the other may hit session conflict in tests)
-    success_count = sum(
-        1 for r in responses 
-        if not isinstance(r, Exception) and r.status_code == 202
-    )
-    
-    assert success_count >= 1, "At least one request should succeed"
-    
-    # Verify call was created
-    response = await client.get(f"/v1/call/{call_id}")
-    assert response.status_code == 200
+    Same-sequence copies carry distinct data (v1, v2, ...): exactly one is
+    stored and the rest are answered as duplicates of it.
+    """
+    call_id = f"TEST-RACE-{n_concurrent}"
+    if same_sequence:
+        bodies = [
+            orjson.dumps({"sequence": 0, "data": f"packet_0_v{i}", "timestamp": _PAYLOAD_TS})
+            for i in range(1, n_concurrent + 1)
+        ]
+    else:
+        bodies = _SEQ_PAYLOADS[:n_concurrent]
+    
+    responses = await _post_concurrently(client, call_id, bodies)
+    
+    # One pass over the responses; a failure shows every status it hit
+    status_counts = Counter(r.status_code for r in responses)
+    assert status_counts == {202: n_concurrent}, f"Requests failed: {status_counts}"
+    
+    # Verify call was created (straight from the database)
+    call = await _get_call(db_session, call_id)
+    stored = (await db_session.scalars(
+        select(CallPacket.data).where(CallPacket.call_id == call_id)
+    )).all()
+    if same_sequence:
+        outcomes = Counter(r.json()["status"] for r in responses)
+        assert outcomes == {"accepted": 1, "duplicate": n_concurrent - 1}, outcomes
+        assert call.total_packets == 1
+        
+        # The stored row is the copy whose request was accepted
+        winner = next(
+            orjson.loads(body)["data"]
+            for body, r in zip(bodies, responses)
+            if r.json()["status"] == "accepted"
+        )
+        assert stored == [winner]
+        assert len({r.json()["received_at"] for r in responses}) == 1
+    else:
+        assert call.total_packets == n_concurrent
+        assert len(stored) == n_concurrent
 
 
-@pytest.mark.asyncio
-async def test_sequential_packets_after_concurrent_attempt(client: AsyncClient):
+async def test_sequential_packets_after_concurrent_attempt(
+    client: AsyncClient,
+    db_session: AsyncSession
+):
     """
     Test that system recovers from race condition and continues working
     """
     call_id = "TEST-RACE-RECOVERY"
+    url = f"/v1/call/stream/{call_id}"
     
-    # Try concurrent (may have conflicts)
-    tasks = [
-        client.post(
-            f"/v1/call/stream/{call_id}",
-            json={"sequence": i, "data": f"packet_{i}", "timestamp": 1738512345.0 + i}
-        )
-        for i in range(3)
-    ]
-    await asyncio.gather(*tasks, return_exceptions=True)
-    
-    # Wait a bit
-    await asyncio.sleep(0.1)
+    # Send concurrently first
+    responses = await _post_concurrently(client, call_id, _SEQ_PAYLOADS[:3])
+    assert all(r.status_code == 202 for r in responses), f"Requests failed: {responses}"
     
-    # Then send sequentially (should all work)
+    # Then stream in order, as a live call does. Kept serial on purpose:
+    # each packet must be seen as in order after the concurrent burst
+    post = client.post
     for i in range(3, 6):
-        response = await client.post(
-            f"/v1/call/stream/{call_id}",
-            json={"sequence": i, "data": f"packet_{i}", "timestamp": 1738512345.0 + i}
+        response = await post(
+            url,
+            content=_SEQ_PAYLOADS[i],
+            headers=_JSON_HEADERS
         )
         assert response.status_code == 202
+        assert response.json()["status"] == "accepted"
     
     # Verify call exists and has packets
-    response = await client.get(f"/v1/call/{call_id}")
-    assert response.status_code == 200
-    call_data = response.json()
-    assert call_data["total_packets"] >= 3
+    call = await _get_call(db_session, call_id)
+    assert call.total_packets == 6
 
 
-@pytest.mark.asyncio 
-async def test_database_locking_documentation(client: AsyncClient):
+async def test_sequence_check_sees_packets_committed_during_lock_wait(
+    db_session: AsyncSession
+):
     """
-    Documents database locking behavior:
-    
-    In this test environment, we use a single shared database session.
-    When multiple requests arrive simultaneously, SQLAlchemy's async session
-    properly prevents concurrent access with:
-    "This session is provisioning a new connection; concurrent operations 
-    are not permitted"
-    
-    In production with FastAPI:
-    - Each request gets its own database session via Depends(get_db)
-    - Multiple requests can safely run concurrently
-    - PostgreSQL handles row-level locking for actual conflicts
-    
-    This test demonstrates the system handles race conditions gracefully
-    rather than crashing.
+    A batch that waits on another worker's call row lock must validate
+    against the packets that worker committed, not its own start snapshot
+    (two batchers = two uvicorn workers or instances)
     """
-    call_id = "TEST-LOCKING"
+    call_id = "TEST-RACE-LOCK-WAIT"
+    await CallService.ensure_call(db_session, call_id)
+    await CallService.add_packets(
+        db_session, [PendingPacket(call_id, 0, "packet_0", _PAYLOAD_TS)]
+    )
     
-    # Attempt concurrent operations
-    tasks = [
-        client.post(
-            f"/v1/call/stream/{call_id}",
-            json={"sequence": 0, "data": "data", "timestamp": 1738512345.0}
+    async with TestSessionLocal() as worker_a, TestSessionLocal() as worker_b:
+        # Worker A holds the call row lock mid-batch
+        await worker_a.execute(
+            select(Call.id).where(Call.call_id == call_id).with_for_update()
         )
-        for _ in range(5)
-    ]
-    
-    responses = await asyncio.gather(*tasks, return_exceptions=True)
+        
+        # Worker B's batch for packet 2 blocks on that lock
+        blocked = asyncio.create_task(
+            CallService.add_packets(
+                worker_b, [PendingPacket(call_id, 2, "packet_2", _PAYLOAD_TS + 2)]
+            )
+        )
+        await _wait_for_lock_waiter(db_session)
+        
+        # Worker A stores packet 1 and commits, releasing the lock
+        await CallService.add_packets(
+            worker_a, [PendingPacket(call_id, 1, "packet_1", _PAYLOAD_TS + 1)]
+        )
+        (receipt,) = await blocked
     
-    # Some will succeed, some will fail due to test session limitations
-    # The important thing is: no crashes, no data corruption
-    success_count = sum(
-        1 for r in responses 
-        if not isinstance(r, Exception) and r.status_code == 202
-    )
-    error_count = sum(
-        1 for r in responses 
-        if not isinstance(r, Exception) and r.status_code == 500
-    )
+    assert receipt.is_in_order
+    call = await _get_call(db_session, call_id)
+    await db_session.refresh(call)
+    assert call.total_packets == 3
+    assert call.missing_packets == []
+
+
+async def test_bad_packet_fails_only_its_own_request(db_session: AsyncSession):
+    """
+    A packet the database rejects must not fail the other packets that
+    shared its batch; the batcher retries them in smaller transactions
+    """
+    for call_id in ("TEST-RACE-GOOD", "TEST-RACE-BAD"):
+        await CallService.ensure_call(db_session, call_id)
+    
+    # Bypasses the API schema, which would reject the NUL up front
+    batcher = PacketBatcher(max_delay=0.05, session_factory=TestSessionLocal)
+    good = [
+        batcher.submit("TEST-RACE-GOOD", seq, f"packet_{seq}", _PAYLOAD_TS + seq)
+        for seq in range(2)
+    ]
+    bad = batcher.submit("TEST-RACE-BAD", 0, "packet\x00", _PAYLOAD_TS)
+    good.append(batcher.submit("TEST-RACE-GOOD", 2, "packet_2", _PAYLOAD_TS + 2))
     
-    # At least one succeeded
-    assert success_count >= 1
-    # Others failed gracefully with 500, not crashes
-    assert success_count + error_count == 5
+    receipts = await asyncio.gather(*good)
+    with pytest.raises(Exception):
+        await bad
+    await batcher.stop()
     
-    # Call was created successfully
-    response = await client.get(f"/v1/call/{call_id}")
-    assert response.status_code == 200
\ No newline at end of file
+    assert all(receipt.is_in_order for receipt in receipts)
+    assert (await _get_call(db_session, "TEST-RACE-GOOD")).total_packets == 3
+    assert (await _get_call(db_session, "TEST-RACE-BAD")).total_packets == 0